@@ -0,0 +1 @@
+"""Benchmark harness; run with `python -m benchmarks.run`."""
@@ -0,0 +1,273 @@
+"""
+Benchmarks for the scrape -> persist -> render pipeline.
+
+Runs the app against a throwaway SQLite database with the offer site,
+Nominatim and SMTP replaced by the local stubs in stubs.py, so numbers do
+not depend on the network. Four scenarios are measured:
+
+    single  one interactive search: scrape_deals and deal storage
+    tick    one scheduler tick over --searches due saved searches
+    deals   the home page and /get-deals for a user with --deals deals
+    startup a cold start of the web app in a new process
+
+Each reports latency percentiles, throughput and the process's peak RSS so
+far. Deal alerts queued by a scenario are sent afterwards, outside the
+timing, and reported as the number of mails. The startup scenario imports
+main.py and serves /login in fresh interpreters, as a serverless cold start
+does, and lists which of the heavy scraping modules got loaded.
+
+Usage, from the repository root:
+
+    python -m benchmarks.run [--only single,tick,deals,startup] [--json results.json]
+
+Settings the app reads from the environment (e.g. SCRAPER_FETCHER,
+OFFER_CACHE_TTL) can be overridden as usual; the harness only fills in
+defaults.
+"""
+from datetime import datetime, timedelta
+import argparse
+import subprocess
+import resource
+import tempfile
+import logging
+import time
+import json
+import sys
+import os
+
+from .stubs import OfferStub, SMTPStub
+
+SCENARIOS = ('single', 'tick', 'deals', 'startup')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('playwright', 'geopy', 'requests', 'smtplib', 'apscheduler')
+STARTUP_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+status = app.test_client().get('/login').status_code
+served = time.perf_counter()
+print(json.dumps({{'import_s': imported - started, 'first_request_s': served - imported, 'status': status,
+                  'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+SCHEDULE_TIME = datetime.strptime('07:00', '%H:%M').time()
+PRODUCTS = ['butter', 'milch', 'kaffee', 'eier', 'mehl', 'bananen', 'wasser', 'schokolade', 'joghurt', 'gouda']
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is in KiB on Linux
+
+
+def summarize(name, samples, operations, elapsed, **extra):
+    result = {
+        'scenario': name,
+        'runs': len(samples),
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000,
+        'throughput_per_s': operations / elapsed if elapsed else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    result.update(extra)
+    print(f"{name:<14} runs={result['runs']:<5} p50={result['p50_ms']:9.1f}ms p95={result['p95_ms']:9.1f}ms "
+          f"p99={result['p99_ms']:9.1f}ms throughput={result['throughput_per_s']:8.1f}/s "
+          f"peak_rss={result['peak_rss_mb']:.0f}MB " + " ".join(f"{k}={v}" for k, v in extra.items()))
+    return result
+
+
+def configure_environment(offers, smtp, workdir):
+    defaults = {
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'MEINPROSPEKT_SEARCH_URL': offers.search_url,
+        'SCRAPER_FETCHER': 'http',
+        'NOMINATIM_DOMAIN': offers.nominatim_domain,
+        'NOMINATIM_SCHEME': 'http',
+        'SMTP_HOST': '127.0.0.1',
+        'SMTP_PORT': str(smtp.port),
+        'SMTP_STARTTLS': '0',
+        'EMAIL_ADDRESS': 'bench@example.com',
+        'EMAIL_PASSWORD': 'bench',
+        'RECIPIENT_EMAIL': 'bench@example.com',
+        'OFFER_CACHE_TTL': '0',  # measure real scrapes unless asked otherwise
+        'SCRAPE_RATE_PER_MINUTE': '0',
+        'NOTIFY_DIGEST_WINDOW': '0',
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def seed(db, users, searches, deals):
+    """Insert users, due saved searches and deals for the first user in bulk."""
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+    from website.models import User, SavedSearch, ScraperResult
+
+    password = generate_password_hash('benchmark')
+    db.session.execute(insert(User), [{
+        'email': f'user{i}@example.com', 'password': password, 'first_name': f'User {i}',
+        'city': 'Berlin', 'country': 'Deutschland', 'latitude': 52.5170365, 'longitude': 13.3888599,
+    } for i in range(users)])
+
+    now = datetime.now()
+    db.session.execute(insert(SavedSearch), [{
+        'user_id': i % users + 1, 'product': PRODUCTS[i % len(PRODUCTS)], 'target_price': 2.0,
+        'city': 'Berlin', 'country': 'Deutschland', 'latitude': 52.5170365, 'longitude': 13.3888599,
+        'email_notification': True, 'schedule_type': 'daily', 'schedule_time': SCHEDULE_TIME,
+        'date_created': now - timedelta(days=1), 'next_run_at': now - timedelta(minutes=1),
+    } for i in range(searches)])
+
+    db.session.execute(insert(ScraperResult), [{
+        'user_id': 1, 'store': f'Store {i % 25}', 'product': PRODUCTS[i % len(PRODUCTS)],
+        'price': 0.5 + (i % 300) / 100, 'target_price': 4.0, 'city': 'Berlin', 'country': 'Deutschland',
+        'data': f'Deal {i}', 'fingerprint': f'bench-{i}', 'date_created': now - timedelta(minutes=i),
+    } for i in range(deals)])
+    db.session.commit()
+
+
+def bench_single(app, iterations):
+    from website.scrapper import scrape_deals
+
+    samples = []
+    started = time.perf_counter()
+    with app.app_context():
+        for i in range(iterations):
+            t0 = time.perf_counter()
+            scrape_deals('Berlin', 'Deutschland', PRODUCTS[i % len(PRODUCTS)], 2.0, True, user_id=1)
+            samples.append(time.perf_counter() - t0)
+    return samples, iterations, time.perf_counter() - started
+
+
+def bench_tick(app, db, repeats, searches):
+    from sqlalchemy import update
+    from website import tasks
+    from website.models import SavedSearch
+
+    samples = []
+    started = time.perf_counter()
+    with app.app_context():
+        for _ in range(repeats):
+            now = datetime.now()
+            db.session.execute(update(SavedSearch).values(next_run_at=now - timedelta(minutes=1)))
+            db.session.commit()
+            t0 = time.perf_counter()
+            tasks.run_due_searches(now)
+            while True:
+                with tasks._running_lock:
+                    if not tasks._running_searches:
+                        break
+                time.sleep(0.01)
+            samples.append(time.perf_counter() - t0)
+    return samples, repeats * searches, time.perf_counter() - started
+
+
+def send_notifications(app):
+    from website.notifications import dispatch_pending
+
+    with app.app_context():
+        while dispatch_pending():
+            pass
+
+
+def bench_deals(app, iterations):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+
+    results = {}
+    etag = client.get('/get-deals').headers['ETag']
+    for name, path, headers in (
+        ('deals_page', '/', {}),
+        ('get_deals', '/get-deals', {}),
+        ('get_deals_304', '/get-deals', {'If-None-Match': etag}),
+    ):
+        samples = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            response = client.get(path, headers=headers)
+            samples.append(time.perf_counter() - t0)
+            assert response.status_code in (200, 304), response.status_code
+        results[name] = (samples, iterations, time.perf_counter() - started)
+    return results
+
+
+def bench_startup(iterations):
+    samples, imports, first_requests = [], [], []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(time.perf_counter() - t0)
+        result = json.loads(output.strip().splitlines()[-1])
+        assert result['status'] == 200, result['status']
+        imports.append(result['import_s'])
+        first_requests.append(result['first_request_s'])
+    extra = {
+        'import_p50_ms': round(percentile(imports, 50) * 1000, 1),
+        'first_request_p50_ms': round(percentile(first_requests, 50) * 1000, 1),
+        'loaded': ','.join(result['loaded']) or 'none',
+    }
+    return samples, iterations, time.perf_counter() - started, extra
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--only', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--searches', type=int, default=1000, help='due saved searches in the tick')
+    parser.add_argument('--deals', type=int, default=5000, help='deals stored for the measured user')
+    parser.add_argument('--iterations', type=int, default=50, help='runs of the single and deals scenarios')
+    parser.add_argument('--tick-repeats', type=int, default=3)
+    parser.add_argument('--startup-runs', type=int, default=10, help='cold starts in the startup scenario')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+    scenarios = [name for name in args.only.split(',') if name]
+
+    offers, smtp = OfferStub(), SMTPStub()
+    configure_environment(offers, smtp, tempfile.mkdtemp(prefix='findmyprize-bench-'))
+
+    # Imported only now: the app reads its settings at import time
+    from website import create_app, init_db, db, scheduler
+
+    app = create_app(start_scheduler=True)
+    scheduler.pause()  # ticks are driven by the benchmark
+    init_db(app)
+    logging.disable(logging.INFO)
+    with app.app_context():
+        seed(db, args.users, args.searches, args.deals)
+
+    results = []
+    if 'single' in scenarios:
+        samples, operations, elapsed = bench_single(app, args.iterations)
+        send_notifications(app)
+        results.append(summarize('single_search', samples, operations, elapsed,
+                                 pages=offers.searches, mails=smtp.messages))
+    if 'tick' in scenarios:
+        pages, mails = offers.searches, smtp.messages
+        samples, operations, elapsed = bench_tick(app, db, args.tick_repeats, args.searches)
+        send_notifications(app)
+        results.append(summarize('scheduler_tick', samples, operations, elapsed,
+                                 pages=offers.searches - pages, mails=smtp.messages - mails))
+    if 'deals' in scenarios:
+        for name, (samples, operations, elapsed) in bench_deals(app, args.iterations).items():
+            results.append(summarize(name, samples, operations, elapsed))
+    if 'startup' in scenarios:
+        samples, operations, elapsed, extra = bench_startup(args.startup_runs)
+        results.append(summarize('cold_start', samples, operations, elapsed, **extra))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    scheduler.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Local stand-ins for the services the pipeline talks to.
+
+`OfferStub` is an HTTP server that answers meinprospekt searches with saved
+result pages from benchmarks/fixtures (`<query>.html` if present, else
+`results.html`) and Nominatim searches with a fixed location. `SMTPStub`
+accepts and counts mail (and connections) without delivering it. Both
+listen on 127.0.0.1 on a free port and run on daemon threads.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import socketserver
+import threading
+import json
+import os
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+NOMINATIM_RESULT = [{
+    'place_id': 1,
+    'lat': '52.5170365',
+    'lon': '13.3888599',
+    'display_name': 'Berlin, Deutschland',
+    'boundingbox': ['52.3382448', '52.6755087', '13.0883450', '13.7611609'],
+    'class': 'boundary',
+    'type': 'administrative',
+}]
+
+
+def _load_fixtures():
+    fixtures = {}
+    for name in os.listdir(FIXTURES_DIR):
+        if name.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+                fixtures[name[:-len('.html')]] = f.read()
+    return fixtures
+
+
+class _OfferHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/webapp'):
+            self.server.searches += 1
+            product = (query.get('query') or [''])[0].lower()
+            fixtures = self.server.fixtures
+            self._reply(200, 'text/html; charset=utf-8', fixtures.get(product, fixtures['results']))
+        elif url.path.startswith('/search'):
+            self.server.geocodes += 1
+            self._reply(200, 'application/json', json.dumps(NOMINATIM_RESULT).encode('utf-8'))
+        else:
+            self._reply(404, 'text/plain', b'not found')
+
+    def _reply(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OfferStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _OfferHandler)
+        self.fixtures = _load_fixtures()
+        self.searches = 0
+        self.geocodes = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def search_url(self):
+        return self.base_url + "/webapp/?query={product}&lat={lat}&lng={lng}"
+
+    @property
+    def nominatim_domain(self):
+        return f"127.0.0.1:{self.server_address[1]}"
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, QUIT."""
+
+    def _send(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self._send('220 smtp-stub ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip().split(' ', 1)[0].upper()
+            if command == 'EHLO':
+                self._send('250-smtp-stub')
+                self._send('250 AUTH PLAIN')
+            elif command == 'HELO':
+                self._send('250 smtp-stub')
+            elif command == 'AUTH':
+                self._send('235 Authentication successful')
+            elif command == 'DATA':
+                self._send('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                self.server.messages += 1
+                self._send('250 OK')
+            elif command == 'QUIT':
+                self._send('221 Bye')
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self._send('250 OK')
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.messages = 0
+        self.connections = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
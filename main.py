@@ -1,6 +1,7 @@
-from website import create_app
+from website import create_app, init_db
 
 app = create_app()
 
 if __name__ == '__main__':
+    init_db(app)
     app.run(debug=True)
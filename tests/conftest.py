@@ -0,0 +1,62 @@
+"""
+Shared fixtures. The app and scraper talk to the local stubs from
+benchmarks/stubs.py and use a scratch SQLite database; the environment is
+set here, before any test imports `website`, because its modules read their
+settings at import time.
+"""
+import tempfile
+import os
+import pytest
+
+from benchmarks.stubs import OfferStub, SMTPStub
+
+OFFERS = OfferStub()
+SMTP = SMTPStub()
+WORKDIR = tempfile.mkdtemp(prefix='findmyprize-tests-')
+
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+    'MEINPROSPEKT_SEARCH_URL': OFFERS.search_url,
+    'NOMINATIM_DOMAIN': OFFERS.nominatim_domain,
+    'NOMINATIM_SCHEME': 'http',
+    'SMTP_HOST': '127.0.0.1',
+    'SMTP_PORT': str(SMTP.port),
+    'SMTP_STARTTLS': '0',
+    'EMAIL_ADDRESS': 'test@example.com',
+    'EMAIL_PASSWORD': 'test',
+    'OFFER_CACHE_TTL': '0',
+    'SCRAPE_RATE_PER_MINUTE': '0',
+    'NOTIFY_DIGEST_WINDOW': '0',
+})
+os.environ.pop('RECIPIENT_EMAIL', None)
+
+
+@pytest.fixture
+def offers():
+    return OFFERS
+
+
+@pytest.fixture
+def smtp_stub():
+    return SMTP
+
+
+@pytest.fixture(scope='session')
+def app():
+    from website import create_app, init_db
+
+    app = create_app()
+    init_db(app)
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """The database with empty tables, inside an app context."""
+    from website import db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield db
+        db.session.remove()
@@ -0,0 +1,87 @@
+import pytest
+
+from website import scrapper
+from website.http_fetcher import FetchError, fetch_cards, parse_cards
+from benchmarks.stubs import FIXTURES_DIR
+
+BROWSER_CARDS = [{'store': 'Netto', 'product_name': 'Butter', 'price_text': '1,99 €', 'original_price_text': None}]
+
+
+class FakePool:
+    """Stands in for the browser pool; counts the pages it was asked to read."""
+    profile = None
+
+    def __init__(self):
+        self.pages = 0
+
+    def stream(self, fn, timeout=None):
+        self.pages += 1
+        yield from BROWSER_CARDS
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(scrapper, 'get_browser_pool', lambda: pool)
+    return pool
+
+
+def search_url(offers, product='butter'):
+    return offers.search_url.format(product=product, lat=52.5, lng=13.4)
+
+
+def test_parse_cards_reads_the_offer_grid():
+    with open(f"{FIXTURES_DIR}/results.html", encoding='utf-8') as f:
+        cards = parse_cards(f.read())
+
+    assert len(cards) == 40
+    assert cards[0] == {'store': 'Lidl', 'product_name': 'Deutsche Markenbutter 250 g',
+                        'price_text': '3,49 €', 'original_price_text': '4,54 €'}
+    assert all(card['store'] and card['price_text'] for card in cards)
+
+
+def test_parse_cards_without_offer_grid():
+    assert parse_cards('<html><body><div id="app"></div></body></html>') is None
+
+
+def test_fetch_cards(offers):
+    searches = offers.searches
+
+    cards = fetch_cards(search_url(offers))
+
+    assert len(cards) == 40
+    assert offers.searches == searches + 1
+
+
+def test_fetch_cards_raises_on_http_error(offers):
+    with pytest.raises(FetchError):
+        fetch_cards(offers.base_url + '/missing')
+
+
+def test_iter_cards_auto_uses_http(offers, browser):
+    cards = list(scrapper.iter_cards(search_url(offers), 'auto'))
+
+    assert len(cards) == 40
+    assert browser.pages == 0
+
+
+def test_iter_cards_auto_falls_back_to_browser(offers, browser):
+    cards = list(scrapper.iter_cards(offers.base_url + '/missing', 'auto'))
+
+    assert cards == BROWSER_CARDS
+    assert browser.pages == 1
+
+
+def test_iter_cards_http_does_not_fall_back(offers, browser):
+    with pytest.raises(FetchError):
+        list(scrapper.iter_cards(offers.base_url + '/missing', 'http'))
+    assert browser.pages == 0
+
+
+def test_browser_fallback_takes_its_own_rate_limit_token(offers, browser, monkeypatch):
+    tokens = []
+    monkeypatch.setattr(scrapper.scrape_limiter, 'acquire', lambda: tokens.append(1))
+
+    list(scrapper.iter_cards(offers.base_url + '/missing', 'auto'))
+
+    assert len(tokens) == 2
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+import json
+import time
+import pytest
+
+from website import job_queue, scrapper
+from website.models import User, SearchJob
+
+
+def add_user(db, **location):
+    user = User(email='anna@example.com', first_name='Anna', password='x', city='Berlin', country='Deutschland',
+                email_notifications=False, **location)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def run_next(worker_id='test-worker'):
+    job = job_queue.claim(worker_id)
+    job_queue.run_job(job)
+    return job
+
+
+def test_job_geocodes_and_remembers_the_user_location(db, offers):
+    user = add_user(db)
+    job_queue.enqueue(user.id, 'butter', 5.0, user.city, user.country, False, fetcher='http')
+
+    job = run_next()
+
+    assert job.status == 'done'
+    assert (job.latitude, job.longitude) == (52.5170365, 13.3888599)
+    assert (user.latitude, user.longitude) == (52.5170365, 13.3888599)
+    assert json.loads(job.results)
+
+
+def test_job_uses_stored_coordinates(db, offers):
+    user = add_user(db, latitude=48.1, longitude=11.6)
+    geocodes = offers.geocodes
+    job_queue.enqueue(user.id, 'butter', 5.0, user.city, user.country, False,
+                      lat=user.latitude, lng=user.longitude, fetcher='http')
+
+    job = run_next()
+
+    assert job.status == 'done'
+    assert offers.geocodes == geocodes
+    assert SearchJob.query.one().latitude == 48.1
+
+
+def test_failed_scrape_fails_the_job(db, monkeypatch):
+    def broken(url, fetcher=None, timeout=None):
+        raise RuntimeError("page broke")
+        yield
+
+    monkeypatch.setattr(scrapper, 'iter_cards', broken)
+    user = add_user(db, latitude=52.5, longitude=13.4)
+    job_queue.enqueue(user.id, 'butter', 5.0, user.city, user.country, False, lat=52.5, lng=13.4)
+    job = job_queue.claim('test-worker')
+
+    with pytest.raises(RuntimeError):
+        job_queue.run_job(job)
+    db.session.rollback()
+    job_queue.fail(job, "page broke")
+
+    assert (job.status, job.attempts, job.error) == ('queued', 1, "page broke")
+
+
+def test_stale_check_follows_the_heartbeat(db):
+    job_queue.enqueue(None, 'butter', 5.0, 'Berlin', 'Deutschland', False)
+    job = job_queue.claim('test-worker')
+    long_ago = datetime.now(timezone.utc) - timedelta(seconds=job_queue.JOB_STALE_AFTER + 60)
+    job.started_at = long_ago
+    db.session.commit()
+
+    job_queue.requeue_stale()
+    assert db.session.get(SearchJob, job.id).status == 'running'
+
+    job.heartbeat_at = long_ago
+    db.session.commit()
+    job_queue.requeue_stale()
+    assert db.session.get(SearchJob, job.id).status == 'queued'
+
+
+def test_heartbeat_touches_the_running_job(app, db):
+    job_queue.enqueue(None, 'butter', 5.0, 'Berlin', 'Deutschland', False)
+    job = job_queue.claim('test-worker')
+    claimed_beat = job.heartbeat_at
+
+    with job_queue.heartbeat(app, job.id, interval=0.05):
+        time.sleep(0.3)
+
+    db.session.rollback()
+    assert db.session.get(SearchJob, job.id).heartbeat_at > claimed_beat
@@ -0,0 +1,39 @@
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+import pytest
+
+from website import metrics
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 'secret')
+    return 'secret'
+
+
+def test_web_metrics_disabled_without_token(app):
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_web_metrics_require_token(app, token):
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 404
+    response = client.get('/metrics', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert b'scrape_phase_seconds' in response.data
+    assert client.get(f'/metrics?token={token}').status_code == 200
+
+
+def test_serve(token):
+    server = metrics.serve(port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    try:
+        with pytest.raises(HTTPError):
+            urlopen(url)
+        with urlopen(Request(url, headers={'Authorization': f'Bearer {token}'})) as response:
+            assert b'scrape_phase_seconds' in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,130 @@
+from datetime import timedelta
+import smtplib
+import socket
+import pytest
+
+from website import notifications
+from website.models import User, Notification
+from website.notifications import SMTPConnection, queue_notification, dispatch_pending
+
+
+@pytest.fixture
+def smtp(db, smtp_stub, monkeypatch):
+    connection = SMTPConnection('127.0.0.1', smtp_stub.port, starttls=False)
+    monkeypatch.setattr(notifications, 'smtp', connection)
+    yield connection
+    connection.close()
+
+
+class BrokenSMTP:
+    def send(self, sender, password, recipient, msg):
+        raise smtplib.SMTPException("mailbox unavailable")
+
+
+def add_user(db, email, email_notifications=True):
+    user = User(email=email, first_name=email.split('@')[0], password='x', email_notifications=email_notifications)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def queue(db, user, count=1):
+    for i in range(count):
+        queue_notification(user.id, f"Deal {i}", f"Body {i}")
+    db.session.commit()
+
+
+def statuses():
+    return [n.status for n in Notification.query.order_by(Notification.id)]
+
+
+def test_alerts_of_one_user_go_out_as_one_digest(db, smtp, smtp_stub):
+    queue(db, add_user(db, 'anna@example.com'), count=3)
+    queue(db, add_user(db, 'ben@example.com'))
+    messages = smtp_stub.messages
+
+    assert dispatch_pending() == 2
+    assert smtp_stub.messages == messages + 2
+    assert statuses() == ['sent'] * 4
+
+
+def test_a_claim_takes_at_most_a_batch_of_notifications(db, smtp, smtp_stub, monkeypatch):
+    monkeypatch.setattr(notifications, 'NOTIFY_BATCH_SIZE', 2)
+    queue(db, add_user(db, 'anna@example.com'), count=3)
+
+    assert dispatch_pending() == 1
+    assert statuses() == ['sent', 'sent', 'pending']
+
+
+def test_users_without_email_notifications_are_skipped(db, smtp, smtp_stub):
+    queue(db, add_user(db, 'anna@example.com', email_notifications=False), count=2)
+    messages = smtp_stub.messages
+
+    assert dispatch_pending() == 0
+    assert smtp_stub.messages == messages
+    assert statuses() == ['skipped', 'skipped']
+
+
+def test_failed_sends_back_off_until_given_up(db, monkeypatch):
+    monkeypatch.setattr(notifications, 'smtp', BrokenSMTP())
+    queue(db, add_user(db, 'anna@example.com'))
+    now = notifications._now()
+
+    delays = []
+    for _ in range(notifications.NOTIFY_MAX_ATTEMPTS):
+        assert dispatch_pending(now) == 0
+        notification = Notification.query.one()
+        if notification.status == 'failed':
+            break
+        assert notification.status == 'pending'
+        retry_at = notification.next_attempt_at.replace(tzinfo=now.tzinfo)
+        delays.append((retry_at - now).total_seconds())
+        now = retry_at
+
+    delay = notifications.NOTIFY_RETRY_DELAY
+    assert delays == [delay * 2 ** i for i in range(notifications.NOTIFY_MAX_ATTEMPTS - 1)]
+    assert notification.status == 'failed'
+    assert notification.attempts == notifications.NOTIFY_MAX_ATTEMPTS
+    assert 'mailbox unavailable' in notification.error
+
+
+def test_stale_sending_rows_are_requeued(db, smtp, smtp_stub):
+    queue(db, add_user(db, 'anna@example.com'))
+    notification = Notification.query.one()
+    notification.status = 'sending'
+    notification.claimed_by = 'dead-worker'
+    notification.next_attempt_at = notifications._now() + timedelta(seconds=notifications.NOTIFY_STALE_AFTER)
+    db.session.commit()
+
+    assert dispatch_pending() == 0  # still held by the other sender
+    assert statuses() == ['sending']
+
+    later = notifications._now() + timedelta(seconds=notifications.NOTIFY_STALE_AFTER + 1)
+    assert dispatch_pending(later) == 1
+    assert statuses() == ['sent']
+
+
+def test_connection_is_reused_between_sends(db, smtp, smtp_stub):
+    connections = smtp_stub.connections
+
+    queue(db, add_user(db, 'anna@example.com'))
+    dispatch_pending()
+    queue(db, add_user(db, 'ben@example.com'))
+    dispatch_pending()
+
+    assert smtp_stub.connections == connections + 1
+    assert statuses() == ['sent', 'sent']
+
+
+def test_reconnects_when_the_server_dropped_the_connection(db, smtp, smtp_stub):
+    queue(db, add_user(db, 'anna@example.com'))
+    dispatch_pending()
+    connections = smtp_stub.connections
+    messages = smtp_stub.messages
+
+    smtp._server.sock.shutdown(socket.SHUT_RDWR)  # as if the server had hung up
+    queue(db, add_user(db, 'ben@example.com'))
+
+    assert dispatch_pending() == 1
+    assert smtp_stub.connections == connections + 1
+    assert smtp_stub.messages == messages + 1
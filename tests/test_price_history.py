@@ -0,0 +1,57 @@
+import pytest
+
+from website import price_history
+from website.models import User, PriceObservation, PriceRollup
+from website.price_history import record_observations
+from website.scrape_engine import ScrapeJob, run_jobs
+
+
+@pytest.fixture
+def client(app, db):
+    user = User(email='anna@example.com', first_name='Anna', password='x', city='Berlin', country='Deutschland')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client
+
+
+def test_observations_join_the_callers_transaction(db):
+    record_observations('Butter', 52.5, 13.4, [('Lidl', 1.99), ('Aldi', 1.79), ('Lidl', 2.19)])
+    db.session.rollback()
+    assert PriceObservation.query.count() == 0
+
+    record_observations('Butter', 52.5, 13.4, [('Lidl', 1.99), ('Aldi', 1.79), ('Lidl', 2.19)])
+    db.session.commit()
+    assert PriceObservation.query.count() == 3
+    assert {(row.store, row.min_price, row.max_price) for row in PriceRollup.query} == {
+        ('Lidl', 1.99, 2.19), ('Aldi', 1.79, 1.79)
+    }
+
+
+def test_failed_observation_write_keeps_the_callers_changes(db, monkeypatch):
+    def broken(rows):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(price_history, '_upsert_rollups', broken)
+    db.session.add(User(email='ben@example.com', first_name='Ben', password='x'))
+
+    record_observations('Butter', 52.5, 13.4, [('Lidl', 1.99)])
+    db.session.commit()
+
+    assert User.query.filter_by(email='ben@example.com').count() == 1
+    assert PriceObservation.query.count() == 0
+
+
+def test_scrape_engine_records_observations(db, offers):
+    run_jobs([ScrapeJob('butter', 2.0, 52.5, 13.4, fetcher='http')])
+    db.session.commit()
+
+    assert PriceObservation.query.count() == 40
+
+
+def test_nearby_without_coordinates_is_rejected(client):
+    response = client.get('/price-history?product=butter&nearby=1')
+
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+import pytest
+
+from website.price_parser import OfferIndex, parse_offer, parse_offers, parse_price, parse_unit_price
+
+
+@pytest.mark.parametrize('text, price', [
+    ('1,99 €', 1.99),
+    ('ab 1,99 €', 1.99),
+    ('1.299,00 €', 1299.0),
+    ('1 299,00 €', 1299.0),
+    ('1\u00a0299,00 €', 1299.0),
+    ('1\u202f299,00 €', 1299.0),
+    ('€ 2.49', 2.49),
+    ('1,-', 1.0),
+    ('2 für 3,00 €', 3.0),
+    ('-25% 1,99 €', 1.99),
+    ('1,99 € 2 500 g', 1.99),
+    ('Preis auf Anfrage', None),
+    ('', None),
+])
+def test_parse_price(text, price):
+    assert parse_price(text) == price
+
+
+@pytest.mark.parametrize('text, unit_price', [
+    ('1,99 €/kg', (1.99, 'kg')),
+    ('2,49 € (1 kg = 9,96 €)', (9.96, 'kg')),
+    ('0,50 €/100 g', (5.0, 'kg')),
+    ('1,29 € je l', (1.29, 'l')),
+    ('1,99 €', (None, None)),
+])
+def test_parse_unit_price(text, unit_price):
+    assert parse_unit_price(text) == unit_price
+
+
+def test_parse_offer():
+    offer = parse_offer({'store': 'Lidl', 'product_name': 'Markenbutter 250 g',
+                         'price_text': '3,49 € (1 kg = 13,96 €)', 'original_price_text': '4,54 €'})
+
+    assert offer.price == 3.49
+    assert offer.original_price == 4.54
+    assert offer.discount == 23
+    assert (offer.unit_price, offer.unit) == (13.96, 'kg')
+
+
+def test_parse_offer_reads_discount_from_price_text():
+    offer = parse_offer({'store': 'Netto', 'product_name': 'Kaffee', 'price_text': '-20% 4,99 €'})
+
+    assert offer.discount == 20
+
+
+def test_parse_offers_skips_unreadable_prices():
+    offers = parse_offers([
+        {'store': 'Lidl', 'product_name': 'Butter', 'price_text': '1,99 €'},
+        {'store': 'Aldi', 'product_name': 'Milch', 'price_text': 'gratis'},
+        {'store': None, 'product_name': 'Eier', 'price_text': '2,49 €'},
+    ])
+
+    assert [offer.store for offer in offers] == ['Lidl']
+
+
+def test_offer_index_at_or_below():
+    index = OfferIndex(parse_offers([
+        {'store': store, 'product_name': 'Butter', 'price_text': price}
+        for store, price in [('A', '2,49 €'), ('B', '1,79 €'), ('C', '1,99 €')]
+    ]))
+
+    assert [offer.store for offer in index.at_or_below(1.99)] == ['B', 'C']
+    assert index.at_or_below(1.0) == []
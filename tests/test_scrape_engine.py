@@ -0,0 +1,84 @@
+import time
+import pytest
+
+from website import scrapper
+from website.browser_pool import BrowserPool
+from website.http_fetcher import FetchError
+from website.scrape_engine import ScrapeJob, run_jobs
+
+CARDS = [
+    {'store': 'Aldi', 'product_name': 'Milch', 'price_text': '0,99 €', 'original_price_text': None},
+    {'store': 'Lidl', 'product_name': 'Milch', 'price_text': '1,29 €', 'original_price_text': None},
+]
+
+
+class FakePool:
+    profile = None
+
+    def __init__(self):
+        self.pages = 0
+
+    def stream(self, fn, timeout=None):
+        self.pages += 1
+        yield from CARDS
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    def needs_browser(url, timeout=None):
+        raise FetchError("No server-rendered offer grid")
+
+    pool = FakePool()
+    monkeypatch.setattr(scrapper, 'fetch_cards', needs_browser)
+    monkeypatch.setattr(scrapper, 'get_browser_pool', lambda: pool)
+    return pool
+
+
+def test_jobs_sharing_a_query_read_one_page(browser):
+    results = run_jobs([
+        ScrapeJob('milch', 1.0, 52.5, 13.4),
+        ScrapeJob('milch', 1.5, 52.5, 13.4),
+        ScrapeJob('kaffee', 1.0, 52.5, 13.4),
+    ])
+
+    assert browser.pages == 2
+    assert [[finding.store for finding in result.findings] for result in results] == [
+        ['Aldi'], ['Aldi', 'Lidl'], ['Aldi']
+    ]
+    assert all(result.ok for result in results)
+
+
+def test_errors_are_reported_per_job(browser, monkeypatch):
+    def broken(url, fetcher=None, timeout=None):
+        raise RuntimeError("page broke")
+        yield
+
+    monkeypatch.setattr(scrapper, 'iter_cards', broken)
+
+    [result] = run_jobs([ScrapeJob('milch', 1.0, 52.5, 13.4)])
+
+    assert not result.ok
+    assert result.error == "page broke"
+
+
+def test_run_jobs_returns_at_the_job_timeout(monkeypatch):
+    def stuck(url, fetcher=None, timeout=None):
+        time.sleep(2)  # ignores its timeout, like a hung page
+        yield from CARDS
+
+    monkeypatch.setattr(scrapper, 'iter_cards', stuck)
+
+    started = time.monotonic()
+    [result] = run_jobs([ScrapeJob('tee', 1.0, 52.5, 13.4)], job_timeout=0.2)
+
+    assert time.monotonic() - started < 1
+    assert not result.ok
+    assert 'Timed out' in result.error
+
+
+def test_browser_pool_stream_times_out():
+    pool = BrowserPool(size=1)
+    pool._start = lambda: None  # no browser ever picks the page up
+
+    with pytest.raises(TimeoutError):
+        list(pool.stream(lambda page, emit: None, timeout=0.1))
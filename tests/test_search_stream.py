@@ -0,0 +1,53 @@
+import pytest
+
+from website import job_queue
+from website.models import User, SearchJob
+
+
+@pytest.fixture
+def client(app, db):
+    user = User(email='anna@example.com', first_name='Anna', password='x', city='Berlin', country='Deutschland',
+                latitude=52.5, longitude=13.4, email_notifications=False)
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client
+
+
+def events(response):
+    return [chunk.split('\n')[0][len('event: '):] for chunk in response.get_data(as_text=True).split('\n\n') if chunk]
+
+
+def test_search_is_queued_by_post_and_streamed_by_id(client, offers):
+    response = client.post('/search', data={'product': 'butter', 'price': '5,00', 'fetcher': 'http'})
+    assert response.status_code == 202
+    job = response.get_json()
+
+    job_queue.run_job(job_queue.claim('test-worker'))
+    streamed = events(client.get(job['stream_url']))
+    streamed_again = events(client.get(job['stream_url']))
+
+    assert streamed[-1] == 'done'
+    assert 'deal' in streamed
+    assert streamed_again == streamed
+    assert SearchJob.query.count() == 1
+
+
+def test_stream_hands_over_to_polling(client, monkeypatch):
+    monkeypatch.setattr('website.views.SEARCH_STREAM_TIMEOUT', 0)
+    job = client.post('/search', data={'product': 'butter', 'price': '5'}).get_json()
+
+    assert events(client.get(job['stream_url'])) == ['pending']
+
+
+def test_stream_of_another_users_job_is_not_found(client):
+    job = job_queue.enqueue(None, 'butter', 5.0, 'Berlin', 'Deutschland', False)
+
+    assert client.get(f'/search/stream/{job.id}').status_code == 404
+
+
+def test_get_does_not_queue_a_search(client):
+    assert client.get('/search?product=butter&price=5').status_code == 405
+    assert SearchJob.query.count() == 0
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+import pytest
+
+from website import scheduler, tasks
+from website.models import SavedSearch, ScraperSchedule, SearchJob
+from website.scrape_engine import ScrapeJobResult
+
+
+@pytest.fixture
+def registered(app, db, monkeypatch):
+    """Cron jobs sync_schedules adds, instead of a running scheduler."""
+    jobs = []
+    monkeypatch.setattr(scheduler, 'app', app, raising=False)
+    monkeypatch.setattr(scheduler, 'get_jobs', lambda: [])
+    monkeypatch.setattr(scheduler, 'add_job', lambda **job: jobs.append(job))
+    return jobs
+
+
+def add_schedule(db, next_run):
+    schedule = ScraperSchedule(user_id=None, product='butter', target_price=2.0, city='Berlin',
+                               country='Deutschland', active=True, next_run=next_run)
+    db.session.add(schedule)
+    db.session.commit()
+    return schedule.id
+
+
+def test_sync_schedules_catches_up_only_beyond_the_misfire_grace(db, registered):
+    missed_long_ago = add_schedule(db, datetime.now() - timedelta(seconds=tasks.SCHEDULE_MISFIRE_GRACE + 60))
+    missed_recently = add_schedule(db, datetime.now() - timedelta(minutes=5))
+
+    tasks.sync_schedules()
+    db.session.rollback()
+
+    assert [job.schedule_id for job in SearchJob.query] == [missed_long_ago]
+    assert db.session.get(ScraperSchedule, missed_long_ago).next_run > datetime.now()
+    assert db.session.get(ScraperSchedule, missed_recently).next_run < datetime.now()
+    assert {job['id'] for job in registered} == {f'schedule_{missed_long_ago}', f'schedule_{missed_recently}'}
+    assert all(job['misfire_grace_time'] == tasks.SCHEDULE_MISFIRE_GRACE and job['coalesce'] for job in registered)
+
+
+def test_failed_scheduled_search_is_retried_without_moving_last_run(db, monkeypatch):
+    monkeypatch.setattr(tasks, 'run_jobs', lambda jobs: [ScrapeJobResult(job, error="page broke") for job in jobs])
+    search = SavedSearch(user_id=None, product='butter', target_price=2.0, city='Berlin', country='Deutschland',
+                         latitude=52.5, longitude=13.4, schedule_type='daily', schedule_time=datetime.now().time())
+    db.session.add(search)
+    db.session.commit()
+
+    tasks.run_scheduled_searches([search])
+
+    assert search.last_run is None
+    retry_in = (search.next_run_at - datetime.now()).total_seconds()
+    assert tasks.SCHEDULE_RETRY_DELAY - 5 < retry_in <= tasks.SCHEDULE_RETRY_DELAY
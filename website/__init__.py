@@ -4,6 +4,7 @@ from flask_sqlalchemy import SQLAlchemy
 from os import path
 from flask_login import LoginManager
 from flask_moment import Moment
+import logging
 import re
 import os
 
@@ -11,7 +12,14 @@ db = SQLAlchemy()
 DB_NAME = "database.db"
 scheduler = APScheduler()
 
-def create_app():
+def create_app(start_scheduler=False):
+    """Build the Flask app.
+
+    Only the web tier is set up by default, which keeps cold starts short:
+    the schema is created by `init_db` (`flask --app main init-db`) and the
+    scheduler only runs where start_scheduler is set (worker.py).
+    """
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
     app = Flask(__name__, static_folder='static')
     moment = Moment(app)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-for-local')
@@ -19,7 +27,9 @@ def create_app():
     @app.template_filter('regex_replace')
     def regex_replace(s, find, replace):
         return re.sub(find, replace, s)
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_NAME}'
+    from .database import database_url, engine_options, configure_engine
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
     db.init_app(app)
 
     from .views import views
@@ -28,10 +38,19 @@ def create_app():
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/')
 
+    from . import metrics
+    metrics.init_app(app)
+
     from .models import User, Note
     
     with app.app_context():
-        db.create_all()
+        configure_engine(db.engine)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables and apply the additive migrations."""
+        init_db(app)
+        print('Database initialized')
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -40,12 +59,22 @@ def create_app():
     @login_manager.user_loader
     def load_user(id):
         return User.query.get(int(id))
-    
-    scheduler.init_app(app)
-    scheduler.start()
+
+    if start_scheduler:
+        scheduler.init_app(app)
+        from . import tasks  # registers the scheduled jobs
+        scheduler.start()
 
     return app
 
+def init_db(app):
+    """Create missing tables and columns; run on deploy, not on every cold start."""
+    from .migrations import upgrade
+
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine, db.metadata)
+
 def create_database(app):
     if not path.exists('website/' + DB_NAME):
         db.create_all(app=app)
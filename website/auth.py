@@ -65,7 +65,7 @@ def sign_up():
                 country=request.form.get('country'),
                 date_joined=datetime.now(timezone.utc) 
             )
-            
+            # Coordinates are geocoded by the worker on the first search, not during sign-up
             db.session.add(new_user)
             db.session.commit()
             login_user(new_user, remember=True)
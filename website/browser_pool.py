@@ -0,0 +1,202 @@
+"""
+Process-wide pool of headless Chromium browsers used by the scraper.
+
+Playwright's sync API ties every object to the thread that created it, so each
+slot of the pool is a worker thread that owns one browser with a warm context.
+Callers hand a function to `BrowserPool.stream`; it runs on a free worker with
+a fresh page from that worker's context and the items it emits are yielded
+while the page is read. Only plain data should be emitted - Playwright handles
+are not usable outside the worker thread.
+
+Warm contexts apply the request-interception profile from page_profile.py.
+Browsers are relaunched after `max_pages` pages, when a health check finds them
+disconnected, or when a job leaves them crashed.
+
+Playwright is imported by the worker threads, so importing this module (and
+the scraper) stays cheap until a page is actually rendered.
+"""
+from concurrent.futures import Future
+from website.page_profile import get_page_profile, install_routes
+from website.metrics import timed
+import threading
+import time
+import logging
+import atexit
+import queue
+import sys
+import os
+
+logger = logging.getLogger(__name__)
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "50"))
+BROWSER_HEALTH_CHECK_INTERVAL = int(os.getenv("BROWSER_HEALTH_CHECK_INTERVAL", "60"))  # seconds
+BROWSER_LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage',
+                       '--disable-gpu', '--single-process']
+
+
+def is_timeout_error(error):
+    """True if error is a timeout: a page not read in time, or a Playwright timeout.
+
+    Playwright cannot raise one before it was imported.
+    """
+    if isinstance(error, TimeoutError):
+        return True
+    module = sys.modules.get('playwright.sync_api')
+    return module is not None and isinstance(error, module.TimeoutError)
+
+
+class _BrowserWorker(threading.Thread):
+    def __init__(self, pool, index):
+        super().__init__(name=f"browser-pool-{index}", daemon=True)
+        self.pool = pool
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.pages_served = 0
+
+    def run(self):
+        from playwright.sync_api import sync_playwright
+
+        self.playwright = sync_playwright().start()
+        try:
+            self._warm_up()
+            while True:
+                try:
+                    task = self.pool._tasks.get(timeout=BROWSER_HEALTH_CHECK_INTERVAL)
+                except queue.Empty:
+                    self._health_check()
+                    continue
+                if task is None:
+                    break
+                fn, future = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._execute(fn))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            self._close_browser()
+            self.playwright.stop()
+
+    def _warm_up(self):
+        try:
+            self._ensure_browser()
+        except Exception as e:
+            # Surface launch problems on the first job instead of killing the worker
+            logger.error(f"{self.name}: browser warm-up failed: {str(e)}")
+
+    def _health_check(self):
+        if self.browser is not None and not self.browser.is_connected():
+            logger.warning(f"{self.name}: browser disconnected while idle, relaunching")
+            self._close_browser()
+            self._warm_up()
+
+    def _ensure_browser(self):
+        if self.browser is not None and not self.browser.is_connected():
+            logger.warning(f"{self.name}: browser disconnected, relaunching")
+            self._close_browser()
+        if self.browser is None:
+            with timed('browser_launch'):
+                self.browser = self.playwright.chromium.launch(headless=True, args=BROWSER_LAUNCH_ARGS)
+                self.context = self.browser.new_context(**self.pool.profile.context_options())
+                install_routes(self.context, self.pool.profile)
+            self.pages_served = 0
+            logger.debug(f"{self.name}: browser launched")
+
+    def _close_browser(self):
+        if self.browser is None:
+            return
+        try:
+            self.browser.close()
+        except Exception as e:
+            logger.debug(f"{self.name}: error closing browser: {str(e)}")
+        self.browser = None
+        self.context = None
+
+    def _execute(self, fn):
+        self._ensure_browser()
+        page = self.context.new_page()
+        try:
+            return fn(page)
+        finally:
+            try:
+                page.close()
+            except Exception:
+                pass
+            self.pages_served += 1
+            if not self.browser.is_connected():
+                logger.warning(f"{self.name}: browser crashed, recycling")
+                self._close_browser()
+            elif self.pages_served >= self.pool.max_pages:
+                logger.debug(f"{self.name}: served {self.pages_served} pages, recycling")
+                self._close_browser()
+
+
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES, profile=None):
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self.profile = profile or get_page_profile()
+        self._tasks = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for index in range(self.size):
+                worker = _BrowserWorker(self, index)
+                worker.start()
+                self._workers.append(worker)
+            logger.info(f"Browser pool started with {self.size} browsers")
+
+    def stream(self, fn, timeout=None):
+        """Run fn(page, emit) on a pooled browser and yield whatever it emits.
+
+        Items are yielded as soon as fn emits them, while the page is still
+        being read; errors raised by fn are re-raised at the end. timeout
+        bounds the whole read in seconds: past it, TimeoutError is raised and
+        the page is left to finish on its browser thread.
+        """
+        items = queue.Queue()
+        finished = object()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        self._start()
+        future = Future()
+        # Also fires when the browser fails before fn ever runs
+        future.add_done_callback(lambda _: items.put(finished))
+        self._tasks.put((lambda page: fn(page, items.put), future))
+        while True:
+            try:
+                item = items.get(timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+            except queue.Empty:
+                raise TimeoutError(f"Page not read within {timeout}s") from None
+            if item is finished:
+                break
+            yield item
+        future.result()
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._tasks.put(None)
+        for worker in workers:
+            worker.join(timeout=10)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
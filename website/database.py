@@ -0,0 +1,84 @@
+"""
+Database URL and engine settings.
+
+DATABASE_URL selects the database (default: the local SQLite file). For
+PostgreSQL the connection pool is sized with DB_POOL_SIZE / DB_MAX_OVERFLOW,
+connections are pre-pinged and recycled after DB_POOL_RECYCLE seconds so
+ones dropped by the server are not handed out.
+
+SQLite connections switch to WAL journaling and wait up to
+SQLITE_BUSY_TIMEOUT seconds for a lock, so the scheduler, the worker and web
+requests can read while one of them writes instead of failing with
+"database is locked". pysqlite's own transaction handling is switched off
+and SQLAlchemy emits BEGIN itself, so SAVEPOINTs (begin_nested) nest inside
+the session's transaction instead of committing on release.
+
+Serverless deployments (SERVERLESS=1, or on Vercel) keep a pool of one
+connection per warm instance with a short recycle time; DB_DISABLE_POOL=1
+opens a connection per checkout for use behind an external pooler such as
+PgBouncer.
+"""
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///database.db")
+SERVERLESS = os.getenv("SERVERLESS", "1" if os.getenv("VERCEL") else "0") == "1"
+DB_DISABLE_POOL = os.getenv("DB_DISABLE_POOL", "0") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "1" if SERVERLESS else "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2" if SERVERLESS else "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300" if SERVERLESS else "1800"))  # seconds
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "15"))  # seconds
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+
+
+def database_url():
+    url = DATABASE_URL
+    # Hosted Postgres providers hand out postgres:// URLs, which SQLAlchemy 2 rejects
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for url."""
+    if url.startswith("sqlite"):
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT}}
+    if DB_DISABLE_POOL:
+        return {'poolclass': NullPool, 'pool_pre_ping': True}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def configure_engine(engine):
+    """Per-connection settings that cannot be passed as engine options."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT * 1000)}")
+            if SQLITE_WAL:
+                cursor.execute("PRAGMA journal_mode = WAL")
+                cursor.execute("PRAGMA synchronous = NORMAL")
+        except Exception as e:
+            # e.g. a read-only database file; keep the default journal
+            logger.warning(f"Could not configure SQLite connection: {str(e)}")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _sqlite_begin(conn):
+        conn.exec_driver_sql("BEGIN")
@@ -0,0 +1,188 @@
+"""
+Cached geocoding in front of the public Nominatim service.
+
+Lookups are keyed on a normalized "city,country" string and answered from an
+in-process LRU first, then from the `GeocodeCache` table, and only then from
+Nominatim. Misses ("no such place") are cached too, with a shorter TTL.
+Service failures are never cached, so a Nominatim outage does not poison
+the cache.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from flask import has_app_context
+import threading
+import logging
+import time
+import os
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_TTL = int(os.getenv("GEOCODE_TTL", str(30 * 24 * 3600)))  # seconds
+GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", "3600"))  # seconds
+GEOCODE_MEMORY_SIZE = int(os.getenv("GEOCODE_MEMORY_SIZE", "1024"))
+
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https")
+
+_geolocator = None  # created on first lookup; geopy is only imported when Nominatim is needed
+
+_memory = OrderedDict()  # location_key -> (GeocodeResult or None, expires_at)
+_memory_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class GeocodeResult:
+    latitude: float
+    longitude: float
+    address: str
+
+
+class GeocoderUnavailableError(Exception):
+    """Nominatim could not be reached after all retries."""
+
+
+def normalize_location(location_string):
+    parts = [" ".join(part.split()).lower() for part in location_string.split(",")]
+    return ",".join(part for part in parts if part)
+
+
+def _memory_get(key):
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return False, None
+        result, expires_at = entry
+        if expires_at < time.monotonic():
+            del _memory[key]
+            return False, None
+        _memory.move_to_end(key)
+        return True, result
+
+
+def _memory_put(key, result, ttl):
+    with _memory_lock:
+        _memory[key] = (result, time.monotonic() + ttl)
+        _memory.move_to_end(key)
+        while len(_memory) > GEOCODE_MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _db_get(key):
+    from .models import GeocodeCache
+
+    row = GeocodeCache.query.filter_by(location_key=key).first()
+    if row is None:
+        return False, None, 0
+    ttl = GEOCODE_TTL if row.found else GEOCODE_NEGATIVE_TTL
+    updated_at = row.updated_at
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    remaining = (updated_at + timedelta(seconds=ttl) - datetime.now(timezone.utc)).total_seconds()
+    if remaining <= 0:
+        return False, None, 0
+    result = GeocodeResult(row.latitude, row.longitude, row.address) if row.found else None
+    return True, result, remaining
+
+
+def _db_put(key, result):
+    from . import db
+    from .models import GeocodeCache
+
+    # The savepoint flushes the caller's pending changes and, if this write
+    # fails, undoes only this write; the row is committed with the caller's
+    # transaction
+    try:
+        with db.session.begin_nested():
+            row = GeocodeCache.query.filter_by(location_key=key).first()
+            if row is None:
+                row = GeocodeCache(location_key=key)
+                db.session.add(row)
+            row.found = result is not None
+            row.latitude = result.latitude if result else None
+            row.longitude = result.longitude if result else None
+            row.address = result.address if result else None
+            row.updated_at = datetime.now(timezone.utc)
+    except Exception as e:
+        # A concurrent writer stored the same key first; their answer is as good as ours
+        logger.debug(f"Could not store geocode cache entry for {key}: {str(e)}")
+
+
+def get_geolocator():
+    global _geolocator
+    if _geolocator is None:
+        from geopy.geocoders import Nominatim
+
+        _geolocator = Nominatim(user_agent="FindmyPrize_Flask", timeout=10, domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
+    return _geolocator
+
+
+def _lookup(location_string, max_attempts, initial_delay):
+    from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+
+    geolocator = get_geolocator()
+    for attempt in range(max_attempts):
+        try:
+            location = geolocator.geocode(location_string)
+        except (GeocoderTimedOut, GeocoderUnavailable):
+            delay = initial_delay * (2 ** attempt)  # Exponential backoff
+            time.sleep(delay)
+            continue
+        if location:
+            return GeocodeResult(location.latitude, location.longitude, location.address)
+        return None
+    raise GeocoderUnavailableError(location_string)
+
+
+def geocode(location_string, max_attempts=5, initial_delay=1):
+    """Return a GeocodeResult for location_string, or None if it cannot be resolved."""
+    with timed('geocode'):
+        return _geocode(location_string, max_attempts, initial_delay)
+
+
+def _geocode(location_string, max_attempts, initial_delay):
+    key = normalize_location(location_string)
+    if not key:
+        return None
+
+    hit, result = _memory_get(key)
+    if hit:
+        return result
+
+    use_db = has_app_context()
+    if use_db:
+        hit, result, remaining = _db_get(key)
+        if hit:
+            _memory_put(key, result, remaining)
+            return result
+
+    try:
+        result = _lookup(location_string, max_attempts, initial_delay)
+    except GeocoderUnavailableError:
+        logger.error(f"Geocoding service unavailable for {location_string}")
+        return None
+
+    _memory_put(key, result, GEOCODE_TTL if result else GEOCODE_NEGATIVE_TTL)
+    if use_db:
+        _db_put(key, result)
+    return result
+
+
+def resolve_coordinates(record):
+    """Fill in and return (latitude, longitude) for a User or SavedSearch.
+
+    Coordinates already stored on the record are reused; otherwise its city
+    and country are geocoded and written back (the caller commits).
+    Returns None if the location cannot be resolved.
+    """
+    if record.latitude is not None and record.longitude is not None:
+        return record.latitude, record.longitude
+    if not record.city or not record.country:
+        return None
+    result = geocode(f"{record.city},{record.country}")
+    if result is None:
+        return None
+    record.latitude = result.latitude
+    record.longitude = result.longitude
+    return record.latitude, record.longitude
@@ -0,0 +1,140 @@
+"""
+Browser-less fetcher for meinprospekt result pages.
+
+The offer cards only carry store, title and prices, so when the results page
+is served with its cards already rendered they can be read with one pooled
+HTTP request and the standard library's HTML parser instead of a Chromium
+page. `fetch_cards` returns the same card dicts as `scrapper.scrape_cards`
+and raises `FetchError` whenever the HTML does not contain the offer grid
+(e.g. the client-side app shell), so callers can fall back to the browser.
+"""
+from html.parser import HTMLParser
+from requests.adapters import HTTPAdapter
+import requests
+import threading
+import logging
+import os
+from website.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.getenv("SCRAPER_HTTP_TIMEOUT", "10"))  # seconds
+HTTP_POOL_SIZE = int(os.getenv("SCRAPER_HTTP_POOL_SIZE", "10"))
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Language': 'de-DE,de;q=0.9',
+}
+
+# card class -> field name, mirroring EXTRACT_CARDS_JS in scrapper.py
+CARD_FIELDS = {
+    'card__subtitle': 'store',
+    'card__title': 'product_name',
+    'card__prices-main-price': 'price_text',
+    'card__prices-strike-price': 'original_price_text',
+    'card__prices-former-price': 'original_price_text',
+}
+SECTION_CLASS = 'search-group-grid-content'
+CARD_CLASSES = {'card', 'card--offer', 'slider-preventClick'}
+STRIKE_TAGS = {'del', 's'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class FetchError(Exception):
+    """The page could not be fetched or does not contain server-rendered offers."""
+
+
+class _OfferCardParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.cards = []
+        self.found_section = False
+        self._stack = []  # (tag, roles opened by this element)
+        self._section_depth = 0
+        self._card = None
+        self._field = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        classes = set((dict(attrs).get('class') or '').split())
+        roles = []
+        if SECTION_CLASS in classes:
+            self.found_section = True
+            self._section_depth += 1
+            roles.append('section')
+        if self._section_depth and self._card is None and CARD_CLASSES <= classes:
+            self._card = {'store': None, 'product_name': None, 'price_text': None, 'original_price_text': None}
+            roles.append('card')
+        if self._card is not None and self._field is None:
+            field = next((CARD_FIELDS[name] for name in classes if name in CARD_FIELDS), None)
+            if field is None and tag in STRIKE_TAGS:
+                field = 'original_price_text'
+            if field is not None and self._card[field] is None:
+                self._field = field
+                self._text = []
+                roles.append('field')
+        self._stack.append((tag, roles))
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return  # stray end tag
+        while self._stack:
+            open_tag, roles = self._stack.pop()
+            self._close(roles)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._field is not None:
+            self._text.append(data)
+
+    def _close(self, roles):
+        if 'field' in roles:
+            self._card[self._field] = " ".join("".join(self._text).split()) or None
+            self._field = None
+        if 'card' in roles:
+            self.cards.append(self._card)
+            self._card = None
+        if 'section' in roles:
+            self._section_depth -= 1
+
+
+def parse_cards(html):
+    """Return the offer card dicts in html, or None if it has no offer grid."""
+    parser = _OfferCardParser()
+    parser.feed(html)
+    parser.close()
+    return parser.cards if parser.found_section else None
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session.headers.update(HTTP_HEADERS)
+        return _session
+
+
+def fetch_cards(url, timeout=HTTP_TIMEOUT):
+    logger.debug(f"Fetching URL over HTTP: {url}")
+    try:
+        with timed('http_fetch'):
+            response = get_session().get(url, timeout=timeout)
+    except requests.RequestException as e:
+        raise FetchError(str(e)) from e
+    if response.status_code != 200:
+        raise FetchError(f"HTTP {response.status_code} for {url}")
+    with timed('extraction'):
+        cards = parse_cards(response.text)
+    if cards is None:
+        raise FetchError(f"No server-rendered offer grid at {url}")
+    return cards
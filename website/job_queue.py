@@ -0,0 +1,229 @@
+"""
+Database-backed queue of scrape jobs between the web tier and workers.
+
+HTTP handlers call `enqueue` and return immediately with the job id; worker
+processes (`python worker.py`) `claim` queued jobs, run the scraper and mark
+them `complete` or `fail`. Claiming is a conditional UPDATE on the job's
+status, so any number of workers can share one SQLite or Postgres database
+without handing the same job out twice. A worker touches its job's
+heartbeat every JOB_HEARTBEAT_INTERVAL seconds while it runs; jobs whose
+heartbeat is older than JOB_STALE_AFTER seconds are put back in the queue. While a job runs, the deals found
+so far are saved in its results every JOB_PROGRESS_INTERVAL seconds, which is
+what the streaming search reads.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import update, func
+import threading
+import logging
+import socket
+import json
+import time
+import os
+from . import db
+from .models import SearchJob
+from .metrics import traced
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "600"))  # seconds
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "60"))  # seconds, well below JOB_STALE_AFTER
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))  # seconds
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))  # seconds
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def enqueue(user_id, product, target_price, city, country, email_notification,
+            lat=None, lng=None, schedule_id=None, fetcher=None):
+    job = SearchJob(
+        user_id=user_id,
+        schedule_id=schedule_id,
+        product=product,
+        target_price=float(target_price),
+        city=city,
+        country=country,
+        latitude=lat,
+        longitude=lng,
+        email_notification=email_notification,
+        fetcher=fetcher
+    )
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"Queued job {job.id} for {product} in {city}, {country}")
+    return job
+
+
+def requeue_stale():
+    """Put jobs back whose worker stopped reporting, or fail them if out of attempts."""
+    cutoff = _now() - timedelta(seconds=JOB_STALE_AFTER)
+    stale = (SearchJob.status == 'running') & (func.coalesce(SearchJob.heartbeat_at, SearchJob.started_at) < cutoff)
+    db.session.execute(
+        update(SearchJob).where(stale, SearchJob.attempts < JOB_MAX_ATTEMPTS)
+        .values(status='queued', worker_id=None)
+    )
+    db.session.execute(
+        update(SearchJob).where(stale, SearchJob.attempts >= JOB_MAX_ATTEMPTS)
+        .values(status='failed', error='Worker timed out', finished_at=_now())
+    )
+    db.session.commit()
+
+
+def claim(worker_id):
+    """Take the oldest queued job for worker_id, or return None if there is none."""
+    for _ in range(5):
+        job_id = db.session.query(SearchJob.id).filter_by(status='queued').order_by(SearchJob.id).limit(1).scalar()
+        if job_id is None:
+            return None
+        claimed = db.session.execute(
+            update(SearchJob)
+            .where(SearchJob.id == job_id, SearchJob.status == 'queued')
+            .values(status='running', worker_id=worker_id, started_at=_now(), heartbeat_at=_now(),
+                    attempts=SearchJob.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(SearchJob, job_id)
+        # Another worker won the race for this job; try the next one
+    return None
+
+
+def _dump_results(results):
+    return json.dumps(results, default=lambda value: value.isoformat())
+
+
+def save_progress(job, results):
+    """Store the deals found so far; the job is still running."""
+    job.results = _dump_results(results)
+    db.session.commit()
+
+
+def complete(job, results):
+    job.status = 'done'
+    job.results = _dump_results(results)
+    job.error = None
+    job.finished_at = _now()
+    db.session.commit()
+
+
+def fail(job, error):
+    job.error = str(error)[:500]
+    if job.attempts < JOB_MAX_ATTEMPTS:
+        job.status = 'queued'
+        job.worker_id = None
+    else:
+        job.status = 'failed'
+        job.finished_at = _now()
+    db.session.commit()
+
+
+def _progress_writer(job):
+    """An on_finding callback saving the job's deals so far, at most every JOB_PROGRESS_INTERVAL seconds."""
+    from .scrapper import deal_dict
+
+    found = []
+    last_saved = 0.0
+
+    def on_finding(finding):
+        nonlocal last_saved
+        found.append(deal_dict(finding, job.target_price))
+        if time.monotonic() - last_saved >= JOB_PROGRESS_INTERVAL:
+            save_progress(job, found)
+            last_saved = time.monotonic()
+
+    return on_finding
+
+
+def _resolve_location(job):
+    """Geocode a job queued without coordinates and keep them on the job and its user."""
+    from .geocoding import resolve_coordinates
+
+    if resolve_coordinates(job) is None:
+        raise LookupError(f"Could not geocode {job.city}, {job.country}")
+    user = job.user
+    if user is not None and user.latitude is None and (user.city, user.country) == (job.city, job.country):
+        user.latitude, user.longitude = job.latitude, job.longitude
+    db.session.commit()
+
+
+def run_job(job):
+    from .scrapper import scrape_deals
+
+    with traced(f"job {job.id}"):
+        # The web tier queues searches without geocoding them; it is done here, once per user
+        _resolve_location(job)
+        results = scrape_deals(
+            city=job.city,
+            country=job.country,
+            product=job.product,
+            target_price=job.target_price,
+            should_send_email=job.email_notification,
+            user_id=job.user_id,
+            lat=job.latitude,
+            lng=job.longitude,
+            fetcher=job.fetcher,
+            on_finding=_progress_writer(job)
+        )
+    complete(job, results)
+    return results
+
+
+@contextmanager
+def heartbeat(app, job_id, interval=JOB_HEARTBEAT_INTERVAL):
+    """Touch the job's heartbeat_at every interval seconds from a thread of its own while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    db.session.execute(
+                        update(SearchJob).where(SearchJob.id == job_id, SearchJob.status == 'running')
+                        .values(heartbeat_at=_now())
+                    )
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"Could not touch heartbeat of job {job_id}: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=beat, name=f"job-{job_id}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def work(app, worker_id=None, poll_interval=WORKER_POLL_INTERVAL):
+    """Claim and run jobs until interrupted."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Worker {worker_id} started")
+    last_stale_check = 0
+    while True:
+        with app.app_context():
+            if time.monotonic() - last_stale_check > JOB_STALE_AFTER / 2:
+                requeue_stale()
+                last_stale_check = time.monotonic()
+
+            job = claim(worker_id)
+            if job is None:
+                db.session.remove()
+                time.sleep(poll_interval)
+                continue
+
+            logger.info(f"Worker {worker_id} running job {job.id}")
+            try:
+                with heartbeat(app, job.id):
+                    run_job(job)
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                db.session.rollback()
+                fail(job, e)
+            finally:
+                db.session.remove()
@@ -0,0 +1,227 @@
+"""
+In-process metrics for the scraper and the scheduler.
+
+A small dependency-free registry of counters, gauges and histograms that
+`/metrics` renders in the Prometheus text format. Hot paths wrap their
+phases in `timed(phase)`, which feeds the `scrape_phase_seconds` histogram
+(geocode, browser_launch, navigation, http_fetch, selector_wait, extraction,
+db_write, email).
+
+With METRICS_TRACE=1 every request, queue job and scheduled batch also logs
+one line listing the phases it went through and how long each took.
+
+Each process keeps its own numbers, so queue workers are measured separately
+from the web process: the web app serves its registry at /metrics, a worker
+with METRICS_PORT set serves its own with `serve`.
+
+Metrics are not public. The web app's /metrics only exists when
+METRICS_TOKEN is set and wants it as a bearer token (or ?token=); the
+worker's endpoint binds to METRICS_HOST, localhost unless configured, and
+checks the same token when one is set.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import Response, request, abort
+import threading
+import hmac
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+METRICS_TRACE = os.getenv("METRICS_TRACE", "0") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # worker only; 0 serves no metrics
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_trace = ContextVar('metrics_trace', default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+scrape_phase_seconds = Histogram('scrape_phase_seconds', 'Time spent in each phase of a search.')
+scrape_timeouts = Counter('scrape_timeouts_total', 'Result pages that did not show offers in time.')
+scrape_errors = Counter('scrape_errors_total', 'Searches that failed with an error other than a timeout.')
+price_parse_failures = Counter('price_parse_failures_total', 'Offer prices that could not be parsed.')
+deals_found = Counter('deals_found_total', 'Offers at or below a target price.')
+scheduler_tick_seconds = Histogram('scheduler_tick_seconds', 'Time to select and dispatch due searches.')
+scheduler_batch_seconds = Histogram('scheduler_batch_seconds', 'Time to run one batch of scheduled searches.')
+scheduler_lag_seconds = Gauge('scheduler_lag_seconds', 'How overdue the oldest due search was at the last tick.')
+scheduler_due_searches = Gauge('scheduler_due_searches', 'Searches due at the last tick.')
+
+REGISTRY = [scrape_phase_seconds, scrape_timeouts, scrape_errors, price_parse_failures, deals_found,
+            scheduler_tick_seconds, scheduler_batch_seconds, scheduler_lag_seconds, scheduler_due_searches]
+
+
+@contextmanager
+def timed(phase):
+    """Record how long the block takes as one observation of phase."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        scrape_phase_seconds.observe(elapsed, phase=phase)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((phase, elapsed))
+
+
+@contextmanager
+def traced(name):
+    """Collect the phases timed inside the block and log them as one line (METRICS_TRACE=1)."""
+    if not METRICS_TRACE:
+        yield
+        return
+    token = _trace.set([])
+    try:
+        yield
+    finally:
+        _log_trace(name, _trace.get())
+        _trace.reset(token)
+
+
+def _log_trace(name, trace):
+    if trace:
+        phases = ' '.join(f"{phase}={elapsed * 1000:.1f}ms" for phase, elapsed in trace)
+        logger.info(f"trace {name} {phases}")
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def authorized(authorization, token):
+    """Whether the Authorization header or token parameter carries METRICS_TOKEN."""
+    if not METRICS_TOKEN:
+        return False
+    if authorization and authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):]
+    return hmac.compare_digest((token or '').encode('utf-8'), METRICS_TOKEN.encode('utf-8'))
+
+
+def _metrics_view():
+    if not authorized(request.headers.get('Authorization'), request.args.get('token')):
+        abort(404)
+    return Response(render(), mimetype=CONTENT_TYPE)
+
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve this process's registry at http://host:port/metrics on a daemon thread and return the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit, parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            token = (parse_qs(url.query).get('token') or [None])[0]
+            if url.path != '/metrics' or (METRICS_TOKEN and not authorized(self.headers.get('Authorization'), token)):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def init_app(app):
+    """Serve /metrics (only with METRICS_TOKEN set) and, with METRICS_TRACE=1, log the phases of every request."""
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
+
+    if METRICS_TRACE:
+        @app.before_request
+        def _start_trace():
+            _trace.set([])
+
+        @app.teardown_request
+        def _end_trace(exc=None):
+            _log_trace(f"{request.method} {request.path}", _trace.get())
+            _trace.set(None)
@@ -0,0 +1,110 @@
+"""
+Additive schema upgrades for databases created by an older version of the app.
+
+`db.create_all()` creates missing tables but never touches existing ones, so
+columns added to existing models are listed here and added with ALTER TABLE
+when a database does not have them yet. Entries must stay additive and
+nullable so that old and new code can share a database during a deploy.
+Indexes declared on the models are created afterwards if they are missing.
+"""
+from sqlalchemy import inspect, text, select, update, bindparam
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (table, column, column DDL)
+NEW_COLUMNS = [
+    ('user', 'latitude', 'FLOAT'),
+    ('user', 'longitude', 'FLOAT'),
+    ('saved_search', 'latitude', 'FLOAT'),
+    ('saved_search', 'longitude', 'FLOAT'),
+    ('scraper_result', 'fingerprint', 'VARCHAR(40)'),
+    ('saved_search', 'last_run', 'DATETIME'),
+    ('saved_search', 'next_run_at', 'DATETIME'),
+    ('saved_search', 'fetcher', 'VARCHAR(10)'),
+    ('search_job', 'fetcher', 'VARCHAR(10)'),
+    ('user', 'deals_version', 'INTEGER'),
+    ('user', 'deals_reset_version', 'INTEGER'),
+    ('search_job', 'heartbeat_at', 'DATETIME'),
+]
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _add_columns(engine):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, column, ddl in NEW_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+                logger.info(f"Added column {table}.{column}")
+
+
+def _backfill_fingerprints(engine):
+    """Fingerprint old deals; later copies of the same deal are left NULL."""
+    from .models import ScraperResult
+
+    table = ScraperResult.__table__
+    with engine.begin() as conn:
+        seen = set(conn.execute(
+            select(table.c.fingerprint).where(table.c.fingerprint.is_not(None))
+        ).scalars())
+        rows = conn.execute(
+            select(table.c.id, table.c.user_id, table.c.store, table.c.price, table.c.product,
+                   table.c.target_price, table.c.city, table.c.country)
+            .where(table.c.fingerprint.is_(None), table.c.store.is_not(None))
+            .order_by(table.c.id)
+        ).all()
+        if not rows:
+            return
+
+        updates = []
+        for row in rows:
+            fingerprint = ScraperResult.make_fingerprint(
+                row.user_id, row.store, row.price, row.product, row.target_price, row.city, row.country
+            )
+            if fingerprint not in seen:
+                seen.add(fingerprint)
+                updates.append({'row_id': row.id, 'fp': fingerprint})
+
+        stmt = update(table).where(table.c.id == bindparam('row_id')).values(fingerprint=bindparam('fp'))
+        for start in range(0, len(updates), BACKFILL_BATCH_SIZE):
+            conn.execute(stmt, updates[start:start + BACKFILL_BATCH_SIZE])
+        logger.info(f"Backfilled {len(updates)} deal fingerprints")
+
+
+def _backfill_next_runs(engine):
+    from .models import SavedSearch, compute_next_run
+
+    table = SavedSearch.__table__
+    now = datetime.now()
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(table).where(table.c.schedule_type.is_not(None), table.c.next_run_at.is_(None))
+        ).all()
+        for row in rows:
+            next_run = compute_next_run(row, now)
+            if next_run is not None:
+                conn.execute(update(table).where(table.c.id == row.id).values(next_run_at=next_run))
+
+
+def _create_indexes(engine, metadata):
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def upgrade(engine, metadata):
+    _add_columns(engine)
+    _backfill_fingerprints(engine)
+    _backfill_next_runs(engine)
+    _create_indexes(engine, metadata)
+    # Pooled SQLite connections keep the schema they loaded before the new
+    # indexes existed, and ON CONFLICT targets are resolved against it.
+    engine.dispose()
@@ -3,22 +3,31 @@ This module defines the database models for the application.
 
 The `Note` model represents a note that is associated with a user. It has an `id`, `data`, `date`, and `user_id` field.
 
-The `User` model represents a user of the application. It has an `id`, `email`, `password`, `first_name`, and `notes` field.
+The `User` model represents a user of the application. It has an `id`, `email`, `password`, `first_name`, `notes`, `latitude`, `longitude`, `deals_version` and `deals_reset_version` field. The version counters let `/get-deals` answer pollers with a 304 or only the changes since their last poll.
 
-The `ScraperResult` model represents the result of a web scraping operation. It has an `id`, `data`, `date_created`, `store`, `price`, `user_id`, `product`, `target_price`, `city`, `country`, `email_notification`, and `user` field.
+The `ScraperResult` model represents the result of a web scraping operation. It has an `id`, `data`, `date_created`, `store`, `price`, `user_id`, `product`, `target_price`, `city`, `country`, `email_notification`, `user` and `fingerprint` field. The fingerprint is unique, so a deal is stored only once per user and search.
 
 The `ScraperSchedule` model represents a scheduled web scraping operation. It has an `id`, `user_id`, `interval`, `active`, `last_run`, `next_run`, `product`, `target_price`, `city`, `country`, `email_notification`, and `user` field.
 
-The `SavedSearch` model represents a saved search that a user has created. It has an `id`, `user_id`, `product`, `target_price`, `city`, `country`, `email_notification`, `date_created`, `user`, `schedule_type`, `schedule_time`, and `schedule_days` field.
+The `SavedSearch` model represents a saved search that a user has created. It has an `id`, `user_id`, `product`, `target_price`, `city`, `country`, `email_notification`, `date_created`, `user`, `schedule_type`, `schedule_time`, `schedule_days`, `interval_value`, `interval_unit`, `last_run`, `next_run_at`, `fetcher`, `latitude` and `longitude` field. `next_run_at` is recomputed whenever the schedule changes or the search runs, so the scheduler only has to load due searches.
+
+The `SearchJob` model is a queued scrape handed from the web tier to a worker process (see `job_queue.py`). It moves from `queued` to `running` to `done` or `failed`, and `results` holds the deals found as JSON.
+
+The `DeletedDeal` model is a tombstone for a deal removed one at a time, so pollers can drop it; "clear all" moves `deals_reset_version` instead.
+
+The `PriceObservation` model is one offer price seen by a scrape, and `PriceRollup` keeps its daily minimum, maximum, sum and count per product, store and location cell for trend queries (see `price_history.py`).
+
+The `Notification` model is an outbox row for one deal alert email. Scrapes only insert it; the dispatcher in `notifications.py` sends pending rows as one digest per user and retries failures with backoff.
+
+The `GeocodeCache` model stores geocoder answers keyed on a normalized location string, including negative answers (`found` is False).
 """
 from . import db
 from flask_login import UserMixin
 from sqlalchemy.sql import func
-from geopy.exc import GeocoderTimedOut
-from geopy.geocoders import Nominatim
-from functools import partial
-import time
-from datetime import datetime, timezone
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, inspect, select, update
 
 class Note(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -38,6 +47,10 @@ class User(db.Model, UserMixin):
     email_notifications = db.Column(db.Boolean, default=True)
     browser_notifications = db.Column(db.Boolean, default=False)
     date_joined  = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    deals_version = db.Column(db.Integer, default=0)  # bumped on every change to the user's deals
+    deals_reset_version = db.Column(db.Integer, default=0)  # version of the last "clear all"
 
 class ScraperResult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -53,6 +66,23 @@ class ScraperResult(db.Model):
     email_notification = db.Column(db.Boolean, default=True)
     user = db.relationship('User')
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    fingerprint = db.Column(db.String(40))  # see make_fingerprint
+
+    __table_args__ = (
+        db.Index('ix_scraper_result_user_id_id', 'user_id', 'id'),
+        db.Index('ix_scraper_result_price_id', 'price', 'id'),
+        db.Index('ix_scraper_result_fingerprint', 'fingerprint', unique=True),
+    )
+
+    @staticmethod
+    def make_fingerprint(user_id, store, price, product, target_price, city, country):
+        """Deterministic key of a deal, used to skip deals a user already has."""
+        raw = "|".join([
+            str(user_id), (store or "").strip().lower(), f"{float(price or 0):.2f}",
+            (product or "").strip().lower(), f"{float(target_price or 0):.2f}",
+            (city or "").strip().lower(), (country or "").strip().lower()
+        ])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
 class ScraperSchedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -84,7 +114,203 @@ class SavedSearch(db.Model):
     schedule_time = db.Column(db.Time)
     schedule_days = db.Column(db.String(100))  # Store as comma-separated days
     interval_value = db.Column(db.Integer)
-    interval_unit = db.Column(db.String(10))  # 'minutes' or 'hours'    last_run = db.Column(db.DateTime)
-   
+    interval_unit = db.Column(db.String(10))  # 'minutes' or 'hours'
+    last_run = db.Column(db.DateTime)
+    next_run_at = db.Column(db.DateTime, index=True)  # maintained by compute_next_run, see below
+    fetcher = db.Column(db.String(10))  # 'auto', 'http' or 'browser'; None uses SCRAPER_FETCHER
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+
+class GeocodeCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    location_key = db.Column(db.String(300), unique=True, nullable=False)  # normalized "city,country"
+    found = db.Column(db.Boolean, default=True)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    address = db.Column(db.String(500))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class DeletedDeal(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    deal_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)  # User.deals_version the deletion produced
+
+    __table_args__ = (
+        db.Index('ix_deleted_deal_user_id_version', 'user_id', 'version'),
+    )
+
+class SearchJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, failed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    schedule_id = db.Column(db.Integer, db.ForeignKey('scraper_schedule.id'))
+    product = db.Column(db.String(200))
+    target_price = db.Column(db.Float)
+    city = db.Column(db.String(100))
+    country = db.Column(db.String(100))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    email_notification = db.Column(db.Boolean, default=True)
+    fetcher = db.Column(db.String(10))
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    worker_id = db.Column(db.String(100))
+    error = db.Column(db.String(500))
+    results = db.Column(db.Text)  # JSON list of the deals found
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # touched while a worker runs the job
+    finished_at = db.Column(db.DateTime)
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.Index('ix_search_job_status_id', 'status', 'id'),
+    )
+
+class PriceObservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    product_key = db.Column(db.String(200), nullable=False)  # normalized search query
+    store = db.Column(db.String(100))
+    price = db.Column(db.Float, nullable=False)
+    observed_at = db.Column(db.DateTime, nullable=False)
+    cell_lat = db.Column(db.Integer)  # location grid cell, see offer_cache.cache_key
+    cell_lng = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_price_observation_product_key_observed_at', 'product_key', 'observed_at'),
+    )
+
+class PriceRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    product_key = db.Column(db.String(200), nullable=False)
+    store = db.Column(db.String(100), nullable=False)
+    cell_lat = db.Column(db.Integer, nullable=False)
+    cell_lng = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    min_price = db.Column(db.Float, nullable=False)
+    max_price = db.Column(db.Float, nullable=False)
+    price_sum = db.Column(db.Float, nullable=False)
+    observations = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_price_rollup_key', 'product_key', 'store', 'cell_lat', 'cell_lng', 'day', unique=True),
+        db.Index('ix_price_rollup_product_key_day', 'product_key', 'day'),
+    )
+
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, skipped, failed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    claimed_by = db.Column(db.String(100))
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime)
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.Index('ix_notification_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+# Daily and weekly runs are spread over this many minutes after their slot;
+# 0 makes every search fire exactly on its slot.
+SCHEDULE_JITTER_WINDOW = int(os.getenv("SCHEDULE_JITTER_WINDOW", "30"))
+SCHEDULE_FIELDS = ('schedule_type', 'schedule_time', 'schedule_days', 'interval_value',
+                   'interval_unit', 'duration', 'date_created', 'last_run')
+
+
+def bump_deals_version(user_id, reset=False):
+    """Increment the user's deals version in the current transaction and return it.
+
+    With reset=True the new version also becomes the reset version, telling
+    pollers that older deltas no longer apply and they must reload.
+    """
+    version = func.coalesce(User.deals_version, 0) + 1
+    values = {'deals_version': version}
+    if reset:
+        values['deals_reset_version'] = version
+    db.session.execute(update(User).where(User.id == user_id).values(**values))
+    return db.session.execute(select(User.deals_version).where(User.id == user_id)).scalar()
+
+
+def _schedule_time(value):
+    if isinstance(value, str):
+        return datetime.strptime(value, '%H:%M').time()
+    return value
+
+
+def schedule_jitter(key):
+    """Deterministic offset into the jitter window for key.
+
+    The same key always gets the same offset, so a search keeps its place in
+    the window from one period to the next and still runs once per period.
+    """
+    if SCHEDULE_JITTER_WINDOW <= 0:
+        return timedelta(0)
+    digest = hashlib.sha1(str(key).encode('utf-8')).digest()
+    return timedelta(seconds=int.from_bytes(digest[:4], 'big') % (SCHEDULE_JITTER_WINDOW * 60))
+
+
+def compute_next_run(search, now):
+    """Return when a saved search is next due, or None if it is not scheduled.
+
+    Runs follow the last run (so runs missed while the app was down come due
+    at once); a search that has never run is due at its next slot from now.
+    Daily and weekly slots are shifted by the search's schedule_jitter.
+    A search with a duration is due at its expiry at the latest, so the tick
+    can deactivate it.
+    """
+    if not search.schedule_type:
+        return None
+
+    next_run = None
+    if search.schedule_type == 'manual':
+        if search.interval_value:
+            if search.interval_unit == 'hours':
+                delta = timedelta(hours=int(search.interval_value))
+            else:
+                delta = timedelta(minutes=int(search.interval_value))
+            next_run = search.last_run + delta if search.last_run else now
+
+    elif search.schedule_type in ('daily', 'weekly') and search.schedule_time:
+        at = _schedule_time(search.schedule_time)
+        days = None
+        if search.schedule_type == 'weekly':
+            days = {WEEKDAYS.index(day.strip()) for day in (search.schedule_days or '').split(',')
+                    if day.strip() in WEEKDAYS}
+        if days is None or days:
+            base = search.last_run or now
+            jitter = schedule_jitter(f"{search.user_id}:{search.product}:{search.city}:{search.country}")
+            for offset in range(-1, 8):
+                slot = datetime.combine(base.date() + timedelta(days=offset), at)
+                if days is not None and slot.weekday() not in days:
+                    continue
+                candidate = slot + jitter
+                if candidate > base or (candidate == base and not search.last_run):
+                    next_run = candidate
+                    break
+
+    if search.duration and search.date_created:
+        expires_at = search.date_created + timedelta(minutes=search.duration)
+        if next_run is None or next_run > expires_at:
+            next_run = expires_at
+    return next_run
+
+
+@event.listens_for(SavedSearch, 'before_insert')
+def _saved_search_before_insert(mapper, connection, target):
+    if target.date_created is None:
+        target.date_created = datetime.now()
+    target.next_run_at = compute_next_run(target, datetime.now())
 
 
+@event.listens_for(SavedSearch, 'before_update')
+def _saved_search_before_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in SCHEDULE_FIELDS):
+        target.next_run_at = compute_next_run(target, datetime.now())
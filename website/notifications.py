@@ -0,0 +1,251 @@
+"""
+Outbox for deal alert emails.
+
+Scrapes do not talk to SMTP: `queue_notification` adds a `Notification` row
+in the caller's transaction and `dispatch_pending`, run by the scheduler
+every NOTIFY_INTERVAL seconds, sends what is due. A row waits
+NOTIFY_DIGEST_WINDOW seconds first, so alerts from several searches of the
+same user go out as one digest. Mail goes over a single authenticated SMTP
+connection that stays open between sends and is reopened when the server
+drops it. Failed sends are retried with exponential backoff and given up
+after NOTIFY_MAX_ATTEMPTS.
+"""
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, or_
+import threading
+import smtplib
+import logging
+import uuid
+import time
+import os
+from . import db
+from .models import Notification
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))  # seconds
+SMTP_IDLE_CHECK = float(os.getenv("SMTP_IDLE_CHECK", "60"))  # seconds idle before a NOOP checks the connection
+
+NOTIFY_INTERVAL = int(os.getenv("NOTIFY_INTERVAL", "30"))  # seconds
+NOTIFY_DIGEST_WINDOW = int(os.getenv("NOTIFY_DIGEST_WINDOW", "60"))  # seconds
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "200"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_RETRY_DELAY = int(os.getenv("NOTIFY_RETRY_DELAY", "60"))  # seconds, doubled per failed attempt
+NOTIFY_STALE_AFTER = int(os.getenv("NOTIFY_STALE_AFTER", "600"))  # seconds
+NOTIFY_RETENTION_DAYS = int(os.getenv("NOTIFY_RETENTION_DAYS", "7"))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def queue_notification(user_id, subject, body):
+    """Add a deal alert to the outbox; it is sent after the caller commits."""
+    now = _now()
+    db.session.add(Notification(
+        user_id=user_id,
+        subject=subject,
+        body=body,
+        created_at=now,
+        next_attempt_at=now + timedelta(seconds=NOTIFY_DIGEST_WINDOW)
+    ))
+
+
+class SMTPConnection:
+    """An authenticated SMTP session, opened on first use and reused for later sends."""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, starttls=SMTP_STARTTLS):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self, sender, password):
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            server.starttls()
+        if password:
+            server.login(sender, password)
+        return server
+
+    def _alive(self):
+        if self._server is None:
+            return False
+        if time.monotonic() - self._last_used < SMTP_IDLE_CHECK:
+            return True
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    def _sendmail(self, sender, password, recipient, text):
+        if self._server is None:
+            self._server = self._connect(sender, password)
+        self._server.sendmail(sender, recipient, text)
+        self._last_used = time.monotonic()
+
+    def send(self, sender, password, recipient, msg):
+        text = msg.as_string()
+        with self._lock:
+            if not self._alive():
+                self._close()
+            try:
+                try:
+                    self._sendmail(sender, password, recipient, text)
+                except smtplib.SMTPServerDisconnected:
+                    # Dropped between the check and the send; try once on a fresh connection
+                    self._server = None
+                    self._sendmail(sender, password, recipient, text)
+            except Exception:
+                self._close()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+smtp = SMTPConnection()
+
+
+def _digest(notifications):
+    if len(notifications) == 1:
+        return notifications[0].subject, notifications[0].body
+    subject = f"Deal Alert Digest - {len(notifications)} alerts with new deals"
+    body = f"\n{'#' * 50}\n".join(f"{n.subject}\n{n.body}" for n in notifications)
+    return subject, body
+
+
+def _claim(now):
+    """Mark up to NOTIFY_BATCH_SIZE notifications as sending and return them.
+
+    A user's pending alerts that are not due yet join the digest of one that is.
+    """
+    token = uuid.uuid4().hex
+    pending = Notification.status == 'pending'
+    due_users = select(Notification.user_id).where(pending, Notification.next_attempt_at <= now)
+    ids = db.session.scalars(
+        select(Notification.id)
+        .where(pending, or_(Notification.next_attempt_at <= now, Notification.user_id.in_(due_users)))
+        .order_by(Notification.id)
+        .limit(NOTIFY_BATCH_SIZE)
+    ).all()
+    if not ids:
+        return []
+    db.session.execute(
+        update(Notification)
+        .where(Notification.id.in_(ids), pending)
+        .values(status='sending', claimed_by=token, next_attempt_at=now + timedelta(seconds=NOTIFY_STALE_AFTER))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return Notification.query.filter_by(claimed_by=token, status='sending').order_by(Notification.id).all()
+
+
+def _requeue_stale(now):
+    """Put back notifications whose sender died while holding them."""
+    db.session.execute(
+        update(Notification)
+        .where(Notification.status == 'sending', Notification.next_attempt_at <= now)
+        .values(status='pending', claimed_by=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _purge(now):
+    cutoff = now - timedelta(days=NOTIFY_RETENTION_DAYS)
+    db.session.execute(
+        delete(Notification)
+        .where(Notification.status.in_(('sent', 'skipped', 'failed')), Notification.created_at < cutoff)
+    )
+
+
+def _send_digest(notifications, sender, password, recipient):
+    subject, body = _digest(notifications)
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = recipient
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "plain"))
+    with timed('email'):
+        smtp.send(sender, password, recipient, msg)
+
+
+def _retry_later(notifications, error, now):
+    for notification in notifications:
+        notification.attempts += 1
+        notification.error = str(error)[:500]
+        notification.claimed_by = None
+        if notification.attempts >= NOTIFY_MAX_ATTEMPTS:
+            notification.status = 'failed'
+        else:
+            notification.status = 'pending'
+            delay = NOTIFY_RETRY_DELAY * (2 ** (notification.attempts - 1))  # Exponential backoff
+            notification.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def dispatch_pending(now=None):
+    """Send every due notification as one email per user and return how many emails went out."""
+    now = now or _now()
+    _requeue_stale(now)
+    db.session.commit()
+
+    notifications = _claim(now)
+    if not notifications:
+        return 0
+
+    load_dotenv()
+    sender = os.getenv("EMAIL_ADDRESS")
+    password = os.getenv("EMAIL_PASSWORD")
+    default_recipient = os.getenv("RECIPIENT_EMAIL")
+
+    by_user = {}
+    for notification in notifications:
+        by_user.setdefault(notification.user_id, []).append(notification)
+
+    sent = 0
+    for user_id, group in by_user.items():
+        user = group[0].user
+        if user is not None and not user.email_notifications:
+            for notification in group:
+                notification.status = 'skipped'
+            db.session.commit()
+            continue
+
+        recipient = default_recipient or (user.email if user is not None else None)
+        try:
+            if not recipient:
+                raise ValueError("No recipient address")
+            _send_digest(group, sender, password, recipient)
+        except Exception as e:
+            logger.warning(f"Could not send {len(group)} notifications for user {user_id}: {str(e)}")
+            _retry_later(group, e, now)
+        else:
+            for notification in group:
+                notification.status = 'sent'
+                notification.sent_at = _now()
+            sent += 1
+        # Commit per user so a crash later in the batch does not resend these
+        db.session.commit()
+
+    _purge(now)
+    db.session.commit()
+    logger.info(f"Sent {sent} notification emails for {len(notifications)} alerts")
+    return sent
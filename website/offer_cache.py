@@ -0,0 +1,119 @@
+"""
+Short-lived cache of scraped offer lists.
+
+Offers on a results page depend only on the product query and the location,
+not on the user's target price, so the raw card dicts of a finished scrape
+are kept in an in-process LRU keyed on the normalized query and a rounded
+lat/lng grid cell. Every search for the same product near the same place
+within OFFER_CACHE_TTL is answered from it and filtered against its own
+target price. OFFER_CACHE_TTL=0 turns the cache off.
+
+`inflight` coalesces scrapes that are running right now: the first caller for
+a key becomes the leader and scrapes, every concurrent caller for the same key
+waits for the leader's cards instead of opening its own page. This holds
+across queued jobs and scheduler batches in one process.
+
+Both are per process: separate workers neither share cached cards nor see
+each other's flights, so two workers picking up the same query at the same
+time still scrape it twice. Web searches are queued for the workers rather
+than scraped in the web process, which keeps the scrapes that can be shared
+in as few processes as there are workers.
+"""
+from collections import OrderedDict
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+OFFER_CACHE_TTL = int(os.getenv("OFFER_CACHE_TTL", "900"))  # seconds
+OFFER_CACHE_SIZE = int(os.getenv("OFFER_CACHE_SIZE", "512"))
+OFFER_CACHE_CELL = float(os.getenv("OFFER_CACHE_CELL", "0.05"))  # degrees, roughly 5 km
+OFFER_WAIT_TIMEOUT = float(os.getenv("OFFER_WAIT_TIMEOUT", "180"))  # seconds a follower waits for the leader
+
+_memory = OrderedDict()  # cache key -> (tuple of card dicts, expires_at)
+_memory_lock = threading.Lock()
+
+
+def normalize_query(product):
+    return " ".join(product.split()).lower()
+
+
+def cache_key(product, lat, lng):
+    return (normalize_query(product), round(lat / OFFER_CACHE_CELL), round(lng / OFFER_CACHE_CELL))
+
+
+def get_offers(product, lat, lng):
+    """Return the cached cards for product near lat/lng, or None on a miss."""
+    if OFFER_CACHE_TTL <= 0:
+        return None
+    key = cache_key(product, lat, lng)
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        cards, expires_at = entry
+        if expires_at < time.monotonic():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+    logger.debug(f"Offer cache hit for {key}")
+    return cards
+
+
+def put_offers(product, lat, lng, cards):
+    """Cache the cards of a completed scrape; partial scrapes must not be stored."""
+    if OFFER_CACHE_TTL <= 0:
+        return
+    key = cache_key(product, lat, lng)
+    with _memory_lock:
+        _memory[key] = (tuple(cards), time.monotonic() + OFFER_CACHE_TTL)
+        _memory.move_to_end(key)
+        while len(_memory) > OFFER_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.cards = None
+        self.error = None
+
+    def wait(self, timeout=OFFER_WAIT_TIMEOUT):
+        """Block until the leader finishes and return its cards or raise its error."""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"In-flight scrape did not finish within {timeout}s")
+        if self.error is not None:
+            if isinstance(self.error, Exception):
+                raise self.error
+            raise RuntimeError("In-flight scrape was abandoned")
+        return self.cards
+
+
+class SingleFlight:
+    """Lets one caller per key do the work while concurrent callers in this process wait for it."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Return (flight, is_leader); the leader must call finish(key, flight, ...)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def finish(self, key, flight, cards=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.cards = cards
+        flight.error = error
+        flight.done.set()
+
+
+inflight = SingleFlight()
@@ -0,0 +1,110 @@
+"""
+Request-interception profiles for scraper pages.
+
+A profile decides which requests a results page may make. Everything we read
+is text in the offer cards, so images, media, fonts and tracking scripts are
+aborted before Chromium downloads them. Profiles are picked with
+SCRAPER_PAGE_PROFILE:
+
+    full    load everything (the old behaviour)
+    light   block images, media, fonts and known trackers (default)
+    strict  like light, and block every host outside SCRAPER_ALLOWED_DOMAINS
+
+SCRAPER_STORAGE_STATE may point to a Playwright storage-state file. Contexts
+start from it when it exists, so cookie-consent choices survive browser
+restarts; it is written after the first successful page if missing.
+"""
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SCRAPER_PAGE_PROFILE = os.getenv("SCRAPER_PAGE_PROFILE", "light")
+SCRAPER_ALLOWED_DOMAINS = tuple(
+    domain.strip() for domain in os.getenv("SCRAPER_ALLOWED_DOMAINS", "meinprospekt.de").split(",") if domain.strip()
+)
+SCRAPER_STORAGE_STATE = os.getenv("SCRAPER_STORAGE_STATE")
+
+HEAVY_RESOURCE_TYPES = frozenset(['image', 'media', 'font'])
+TRACKER_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'facebook.net', 'facebook.com', 'criteo.com', 'adnxs.com', 'hotjar.com', 'scorecardresearch.com',
+)
+
+
+def _matches(host, domains):
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+@dataclass(frozen=True)
+class PageProfile:
+    name: str
+    blocked_resource_types: frozenset = frozenset()
+    blocked_domains: tuple = ()
+    allowed_domains: tuple = ()  # when set, every other host is blocked
+    storage_state: str = None
+
+    @property
+    def intercepts(self):
+        return bool(self.blocked_resource_types or self.blocked_domains or self.allowed_domains)
+
+    def should_block(self, url, resource_type):
+        if resource_type in self.blocked_resource_types:
+            return True
+        host = (urlsplit(url).hostname or '').lower()
+        if not host:
+            return False
+        if self.blocked_domains and _matches(host, self.blocked_domains):
+            return True
+        return bool(self.allowed_domains) and not _matches(host, self.allowed_domains)
+
+    def context_options(self):
+        if self.storage_state and os.path.exists(self.storage_state):
+            return {'storage_state': self.storage_state}
+        return {}
+
+    def needs_storage_state(self):
+        return bool(self.storage_state) and not os.path.exists(self.storage_state)
+
+
+PROFILES = {
+    'full': PageProfile('full'),
+    'light': PageProfile('light', HEAVY_RESOURCE_TYPES, TRACKER_DOMAINS),
+    'strict': PageProfile('strict', HEAVY_RESOURCE_TYPES, TRACKER_DOMAINS, SCRAPER_ALLOWED_DOMAINS),
+}
+
+
+def get_page_profile(name=None):
+    name = name or SCRAPER_PAGE_PROFILE
+    profile = PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"Unknown page profile {name}, using light")
+        profile = PROFILES['light']
+    if SCRAPER_STORAGE_STATE:
+        profile = PageProfile(profile.name, profile.blocked_resource_types, profile.blocked_domains,
+                              profile.allowed_domains, SCRAPER_STORAGE_STATE)
+    return profile
+
+
+def install_routes(context, profile):
+    """Abort the requests profile blocks, for a sync-API browser context."""
+    if not profile.intercepts:
+        return
+
+    def handle(route):
+        request = route.request
+        if profile.should_block(request.url, request.resource_type):
+            route.abort()
+        else:
+            route.continue_()
+
+    context.route("**/*", handle)
+
+
+def save_storage_state(context, profile):
+    if profile.needs_storage_state():
+        context.storage_state(path=profile.storage_state)
+        logger.info(f"Saved browser storage state to {profile.storage_state}")
+
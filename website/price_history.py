@@ -0,0 +1,136 @@
+"""
+Price history of searched products.
+
+Every completed scrape appends the offer prices it saw to `PriceObservation`
+and folds them into `PriceRollup`, which keeps one row per product, store,
+location cell and (UTC) day with the min, max, sum and count of the prices.
+The rollup is upserted in the same transaction, so trend queries such as
+"lowest price in the last 90 days" read a few hundred rollup rows through
+the (product_key, day) index instead of scanning the raw observations.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from flask import has_app_context
+from sqlalchemy import select, insert, update, func
+import logging
+from . import db
+from .models import PriceObservation, PriceRollup
+from .offer_cache import cache_key, normalize_query
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY = ('product_key', 'store', 'cell_lat', 'cell_lng', 'day')
+
+
+def _rollup_rows(observations):
+    rollups = defaultdict(lambda: {'min_price': None, 'max_price': None, 'price_sum': 0.0, 'observations': 0})
+    for row in observations:
+        key = (row['product_key'], row['store'], row['cell_lat'], row['cell_lng'], row['observed_at'].date())
+        rollup = rollups[key]
+        price = row['price']
+        rollup['min_price'] = price if rollup['min_price'] is None else min(rollup['min_price'], price)
+        rollup['max_price'] = price if rollup['max_price'] is None else max(rollup['max_price'], price)
+        rollup['price_sum'] += price
+        rollup['observations'] += 1
+    return [dict(zip(ROLLUP_KEY, key), **values) for key, values in rollups.items()]
+
+
+def _upsert_rollups(rows):
+    table = PriceRollup.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            lower, upper = func.min, func.max  # the two-argument forms are scalar in SQLite
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            lower, upper = func.least, func.greatest
+        stmt = dialect_insert(PriceRollup)
+        stmt = stmt.on_conflict_do_update(index_elements=list(ROLLUP_KEY), set_={
+            'min_price': lower(table.c.min_price, stmt.excluded.min_price),
+            'max_price': upper(table.c.max_price, stmt.excluded.max_price),
+            'price_sum': table.c.price_sum + stmt.excluded.price_sum,
+            'observations': table.c.observations + stmt.excluded.observations,
+        })
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        existing = db.session.execute(
+            select(table.c.id, table.c.min_price, table.c.max_price)
+            .where(*(table.c[name] == row[name] for name in ROLLUP_KEY))
+        ).first()
+        if existing is None:
+            db.session.execute(insert(PriceRollup), [row])
+        else:
+            db.session.execute(update(PriceRollup).where(table.c.id == existing.id).values(
+                min_price=min(existing.min_price, row['min_price']),
+                max_price=max(existing.max_price, row['max_price']),
+                price_sum=table.c.price_sum + row['price_sum'],
+                observations=table.c.observations + row['observations'],
+            ))
+
+
+def record_observations(product, lat, lng, prices, observed_at=None):
+    """Append (store, price) pairs seen for product near lat/lng and update the rollups.
+
+    The rows join the caller's transaction and are committed with it. A
+    failed write is undone on its own through a savepoint, logged and never
+    fails the scrape or throws away the caller's pending changes. Outside an
+    app context (e.g. the engine run from a script) nothing is recorded.
+    """
+    if not prices or not has_app_context():
+        return
+    product_key, cell_lat, cell_lng = cache_key(product, lat, lng)
+    observed_at = observed_at or datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [{
+        'product_key': product_key,
+        'store': store,
+        'price': price,
+        'observed_at': observed_at,
+        'cell_lat': cell_lat,
+        'cell_lng': cell_lng,
+    } for store, price in prices]
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(PriceObservation), rows)
+            _upsert_rollups(_rollup_rows(rows))
+    except Exception as e:
+        logger.error(f"Could not record price history for {product}: {str(e)}")
+
+
+def _rollup_filter(product, days, store=None, lat=None, lng=None):
+    since = datetime.now(timezone.utc).date() - timedelta(days=days)
+    conditions = [PriceRollup.product_key == normalize_query(product), PriceRollup.day >= since]
+    if store:
+        conditions.append(PriceRollup.store == store)
+    if lat is not None and lng is not None:
+        _, cell_lat, cell_lng = cache_key(product, lat, lng)
+        conditions += [PriceRollup.cell_lat == cell_lat, PriceRollup.cell_lng == cell_lng]
+    return conditions
+
+
+def lowest_price(product, days=90, store=None, lat=None, lng=None):
+    """Return (price, store, day) of the lowest price seen in the last days, or None."""
+    return db.session.execute(
+        select(PriceRollup.min_price, PriceRollup.store, PriceRollup.day)
+        .where(*_rollup_filter(product, days, store, lat, lng))
+        .order_by(PriceRollup.min_price.asc())
+        .limit(1)
+    ).first()
+
+
+def daily_trend(product, days=90, store=None, lat=None, lng=None):
+    """Per-day min, average, max and observation count over the last days, oldest first."""
+    return db.session.execute(
+        select(
+            PriceRollup.day,
+            func.min(PriceRollup.min_price).label('min_price'),
+            (func.sum(PriceRollup.price_sum) / func.sum(PriceRollup.observations)).label('avg_price'),
+            func.max(PriceRollup.max_price).label('max_price'),
+            func.sum(PriceRollup.observations).label('observations'),
+        )
+        .where(*_rollup_filter(product, days, store, lat, lng))
+        .group_by(PriceRollup.day)
+        .order_by(PriceRollup.day)
+    ).all()
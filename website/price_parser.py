@@ -0,0 +1,145 @@
+"""
+Price parsing for offer cards.
+
+Card texts come in many shapes: "1,99 €", "ab 1,99 €", "1.299,00 €",
+"€ 2.49", "1,-", "1,99 €/kg", "2,49 € (1 kg = 9,96 €)". `parse_price`
+reads one of them; `parse_offer` normalizes a whole card into an `Offer`
+with price, unit price (per kg, l or Stück), original price and discount.
+All patterns are compiled once at import.
+
+`OfferIndex` sorts one page of offers by price, so checking it against a
+target price is a bisect.
+"""
+from dataclasses import dataclass
+from bisect import bisect_right
+from array import array
+import logging
+import re
+from .metrics import price_parse_failures
+
+logger = logging.getLogger(__name__)
+
+# 1.299,00 | 1 299,00 (space or no-break space) | 12,99 | 2.49 | 1,- | 5
+_THOUSANDS = r'[. \u00a0\u202f]'
+_NUMBER = rf'\d{{1,3}}(?:{_THOUSANDS}\d{{3}})+(?!\d)(?:,(?:\d{{1,2}}|[-–]))?|\d+(?:[.,](?:\d{{1,2}}|[-–]))?'
+_CURRENCY = r'(?:€|EUR)'
+_UNIT = r'(kg|g|l|ml|cl|st(?:ü|ue)ck|stk)\b\.?'
+
+EURO_PRICE_RE = re.compile(rf'{_CURRENCY}\s*({_NUMBER})|({_NUMBER})\s*{_CURRENCY}', re.IGNORECASE)
+NUMBER_RE = re.compile(rf'({_NUMBER})(?!\d|\s*%)')
+THOUSANDS_RE = re.compile(rf'{_THOUSANDS}(?=\d{{3}}(?!\d))')
+# "1 kg = 9,96 €", "100 g = 0,50 €"
+UNIT_EQUALS_RE = re.compile(rf'(\d+(?:[.,]\d+)?)?\s*{_UNIT}\s*=\s*{_CURRENCY}?\s*({_NUMBER})', re.IGNORECASE)
+# "9,96 €/kg", "0,50 €/100 g", "1,29 € je l"
+UNIT_PER_RE = re.compile(rf'({_NUMBER})\s*{_CURRENCY}?\s*(?:/|je|pro)\s*(\d+(?:[.,]\d+)?)?\s*{_UNIT}', re.IGNORECASE)
+DISCOUNT_RE = re.compile(r'-\s*(\d{1,2})\s*%')
+
+# unit as written -> (normalized unit, amount of the normalized unit per written unit)
+UNITS = {'kg': ('kg', 1), 'g': ('kg', 1000), 'l': ('l', 1), 'ml': ('l', 1000), 'cl': ('l', 100),
+         'stück': ('Stück', 1), 'stueck': ('Stück', 1), 'stk': ('Stück', 1)}
+
+
+@dataclass(frozen=True)
+class Offer:
+    store: str
+    product_name: str
+    price: float
+    price_text: str
+    original_price: float = None
+    discount: int = None  # percent off the original price
+    unit_price: float = None
+    unit: str = None  # 'kg', 'l' or 'Stück'
+
+
+def _to_float(token):
+    token = THOUSANDS_RE.sub('', token).replace(',', '.').rstrip('-–')
+    return float(token)
+
+
+def parse_price(text):
+    """The price in text as a float, or None if it has none.
+
+    A number next to a currency sign wins over other numbers, so
+    "2 für 3,00 €" reads as 3.00 and "-25% 1,99 €" as 1.99.
+    """
+    if not text:
+        return None
+    match = EURO_PRICE_RE.search(text) or NUMBER_RE.search(text)
+    if match is None:
+        return None
+    return _to_float(next(group for group in match.groups() if group))
+
+
+def parse_unit_price(text):
+    """(price per kg, l or Stück, unit) found in text, or (None, None)."""
+    if not text:
+        return None, None
+    match = UNIT_EQUALS_RE.search(text)
+    if match:
+        quantity, unit, price = match.groups()
+    else:
+        match = UNIT_PER_RE.search(text)
+        if match is None:
+            return None, None
+        price, quantity, unit = match.groups()
+    unit, per_unit = UNITS[unit.lower()]
+    quantity = _to_float(quantity) if quantity else 1
+    if not quantity:
+        return None, None
+    return round(_to_float(price) * per_unit / quantity, 2), unit
+
+
+def parse_offer(card):
+    """Normalize a scraped card into an Offer; None without a store or a readable price."""
+    store = card.get('store')
+    price_text = card.get('price_text')
+    price = parse_price(price_text)
+    if not store or price is None:
+        return None
+
+    original_price = parse_price(card.get('original_price_text'))
+    if original_price is not None and original_price <= price:
+        original_price = None
+
+    discount = None
+    match = DISCOUNT_RE.search(price_text)
+    if match:
+        discount = int(match.group(1))
+    elif original_price:
+        discount = round((1 - price / original_price) * 100)
+
+    unit_text = ' '.join(filter(None, (price_text, card.get('product_name'))))
+    unit_price, unit = parse_unit_price(unit_text)
+    return Offer(store, card.get('product_name') or "Unknown Product", price, price_text.strip(),
+                 original_price, discount, unit_price, unit)
+
+
+def parse_offers(cards):
+    """Offers of every card with a store and a readable price; unreadable prices are logged once per call."""
+    offers = []
+    unreadable = []
+    for card in cards:
+        offer = parse_offer(card)
+        if offer is not None:
+            offers.append(offer)
+        elif card.get('store') and card.get('price_text'):
+            unreadable.append(card['price_text'])
+    if unreadable:
+        price_parse_failures.inc(len(unreadable))
+        logger.warning(f"Could not read {len(unreadable)} of {len(cards)} prices, e.g. {unreadable[0]!r}")
+    return offers
+
+
+class OfferIndex:
+    """Offers of one page sorted by price, for looking up many target prices."""
+
+    def __init__(self, offers):
+        self.offers = sorted(offers, key=lambda offer: offer.price)
+        self.prices = array('d', (offer.price for offer in self.offers))
+
+    def __len__(self):
+        return len(self.offers)
+
+    def at_or_below(self, target_price):
+        """Offers priced at most target_price, cheapest first."""
+        return self.offers[:bisect_right(self.prices, target_price)]
@@ -0,0 +1,52 @@
+"""
+Process-wide limit on outbound scrapes.
+
+Every request to the offer site, over HTTP or through a browser page, takes a
+token from `scrape_limiter` first. The bucket refills at
+SCRAPE_RATE_PER_MINUTE tokens a minute and holds at most SCRAPE_RATE_BURST,
+so a backlog of due searches (e.g. after downtime) is worked off at a steady
+pace instead of all at once. Cache hits and coalesced scrapes take no token.
+SCRAPE_RATE_PER_MINUTE=0 disables the limit.
+"""
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+SCRAPE_RATE_PER_MINUTE = float(os.getenv("SCRAPE_RATE_PER_MINUTE", "30"))
+SCRAPE_RATE_BURST = int(os.getenv("SCRAPE_RATE_BURST", "5"))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0  # tokens per second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token, returning how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            # Tokens may go negative: waiting callers queue up in reservation order
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        if self.rate <= 0:
+            return
+        delay = self._reserve()
+        if delay > 0:
+            logger.debug(f"Scrape rate limit reached, waiting {delay:.1f}s")
+            time.sleep(delay)
+
+
+scrape_limiter = TokenBucket(SCRAPE_RATE_PER_MINUTE, SCRAPE_RATE_BURST)
@@ -0,0 +1,133 @@
+"""
+Asyncio scraping engine for running many searches in one go.
+
+A batch of `ScrapeJob`s (product, target price, coordinates) is scraped
+concurrently, at most `concurrency` queries at a time, so one slow results
+page no longer holds up the rest of the batch. Each job yields a
+`ScrapeJobResult` with the deals found or the error that stopped it.
+
+The engine only schedules: every query is read through
+`scrapper.iter_offer_cards` on a worker thread, so the cache, the
+single-flight coalescing and the fetcher choice are the same as for a
+single search. Pages that need a browser go to the process-wide
+`BrowserPool`, which uses Playwright's sync API on its own threads; at most
+BROWSER_POOL_SIZE pages are therefore rendered at once whatever
+SCRAPE_CONCURRENCY is, and the rest wait for a free browser. HTTP fetches
+and cache hits are bounded by SCRAPE_CONCURRENCY alone.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import asyncio
+import logging
+import os
+from website.browser_pool import is_timeout_error
+from website.offer_cache import cache_key
+from website.metrics import scrape_timeouts, scrape_errors
+from website.price_parser import parse_offer, OfferIndex
+from website.scrapper import iter_offer_cards, record_prices, deal_finding, SCRAPE_JOB_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "4"))  # queries at a time; browser pages are capped by BROWSER_POOL_SIZE
+
+
+@dataclass
+class ScrapeJob:
+    product: str
+    target_price: float
+    lat: float
+    lng: float
+    tag: object = None  # caller's reference, e.g. the SavedSearch being run
+    fetcher: str = None  # see scrapper.FETCHERS; defaults to SCRAPER_FETCHER
+
+
+@dataclass
+class ScrapeJobResult:
+    job: ScrapeJob
+    findings: list = field(default_factory=list)
+    found: bool = True
+    error: str = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+async def _load_offers(semaphore, executor, job, job_timeout):
+    """Offers for job, indexed by price, read through iter_offer_cards."""
+    scraped = []
+
+    def read():
+        return list(iter_offer_cards(job.product, job.lat, job.lng, job.fetcher, timeout=job_timeout,
+                                     on_scraped=lambda *page: scraped.append(page)))
+
+    async with semaphore:
+        # The read gives up by itself at job_timeout; wait_for only stops waiting
+        # for a thread stuck past it, which is left behind on the executor
+        cards = await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(executor, read),
+                                       timeout=job_timeout)
+    # Recorded here rather than on the executor thread, which has no app
+    # context; the rows join the batch's session and are committed with it
+    for page in scraped:
+        record_prices(*page)
+    # Unreadable prices were already counted by the scrape that read the page
+    return OfferIndex(offer for offer in map(parse_offer, cards) if offer is not None)
+
+
+async def _run_job(job, offers_task, job_timeout):
+    try:
+        offers = await offers_task
+        if not offers:
+            logger.info(f"No Product {job.product} found")
+            return ScrapeJobResult(job, found=False)
+        return ScrapeJobResult(job, [deal_finding(offer, job.target_price)
+                                     for offer in offers.at_or_below(job.target_price)])
+    except asyncio.TimeoutError:
+        logger.error(f"Job for {job.product} exceeded {job_timeout}s and was cancelled")
+        scrape_timeouts.inc()
+        return ScrapeJobResult(job, error=f"Timed out after {job_timeout}s")
+    except Exception as e:
+        if is_timeout_error(e):
+            logger.error(f"Timeout for {job.product}: {str(e)}")
+            scrape_timeouts.inc()
+            return ScrapeJobResult(job, error=f"Timeout: {str(e)}")
+        logger.error(f"Error processing {job.product}: {str(e)}")
+        scrape_errors.inc()
+        return ScrapeJobResult(job, error=str(e))
+
+
+async def scrape_jobs(jobs, concurrency=SCRAPE_CONCURRENCY, job_timeout=SCRAPE_JOB_TIMEOUT, executor=None):
+    """Scrape all jobs concurrently; results come back in job order.
+
+    job_timeout bounds the wall-clock time a job may spend on its page; a
+    job that exceeds it is cancelled and reported as failed. Jobs sharing a
+    query and location cell are scraped once, and the browser pool is only
+    used for jobs not answered by the offer cache or HTTP. Pages are read on
+    executor's threads (the loop's default executor if None).
+    """
+    if not jobs:
+        return []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # Jobs for the same query and location cell share one load and one parse of
+    # the offers; each job's target price is then a bisect into the shared index
+    loads = {}
+    for job in jobs:
+        key = cache_key(job.product, job.lat, job.lng)
+        if key not in loads:
+            loads[key] = asyncio.ensure_future(_load_offers(semaphore, executor, job, job_timeout))
+    return await asyncio.gather(*(
+        _run_job(job, loads[cache_key(job.product, job.lat, job.lng)], job_timeout) for job in jobs
+    ))
+
+
+def run_jobs(jobs, concurrency=SCRAPE_CONCURRENCY, job_timeout=SCRAPE_JOB_TIMEOUT):
+    """Blocking entry point for callers outside an event loop (scheduler, CLI).
+
+    The batch gets its own executor, which is shut down without waiting, so
+    a page still stuck past job_timeout does not hold up the return.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="scrape-job")
+    try:
+        return asyncio.run(scrape_jobs(jobs, concurrency, job_timeout, executor))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
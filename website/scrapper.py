@@ -1,202 +1,336 @@
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 import logging
-from geopy.geocoders import Nominatim
 from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from dotenv import load_dotenv
+import time
 import os
-from dataclasses import dataclass
-from website.models import ScraperResult, db
+from sqlalchemy import insert, select
+from website.models import ScraperResult, db, bump_deals_version
+from website.browser_pool import get_browser_pool, is_timeout_error
+from website.geocoding import geocode
+from website.page_profile import save_storage_state
+from website.http_fetcher import fetch_cards, FetchError, HTTP_TIMEOUT
+from website.offer_cache import get_offers, put_offers, cache_key, inflight
+from website.rate_limit import scrape_limiter
+from website.price_history import record_observations
+from website.notifications import queue_notification
+from website.price_parser import parse_offer, parse_offers
+from website.metrics import timed, scrape_timeouts, scrape_errors, deals_found
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-geolocator = Nominatim(user_agent="FindmyPrize_Flask")
+SEARCH_URL = os.getenv("MEINPROSPEKT_SEARCH_URL", "https://www.meinprospekt.de/webapp/?query={product}&lat={lat}&lng={lng}")
+OFFER_SECTION_SELECTOR = ".search-group-grid-content"
+OFFER_CARD_SELECTOR = ".card.card--offer.slider-preventClick"
+RESULTS_TIMEOUT = 15000  # ms to wait for the offer grid after navigation starts
 
-def run_scraper(city, country, product, target_price, should_send_email, user_id=None):
-    logger.info(f"Starting scraper for {product} in {city}, {country}")
-    
-    # Get location coordinates
-    loc = geolocator.geocode(f"{city},{country}")
-    my_long = loc.longitude
-    my_lat = loc.latitude
-    logger.debug(f"Coordinates found - Latitude: {my_lat}, Longitude: {my_long}")
-
-    # Load environment variables
-    load_dotenv()
-    EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
-    EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-    RECIPIENT_EMAIL = os.getenv("RECIPIENT_EMAIL")
-
-    def send_email(subject, message, should_send_email):
-        if should_send_email:
-            sender_email = EMAIL_ADDRESS
-            sender_password = EMAIL_PASSWORD
-            receiver_email = RECIPIENT_EMAIL
-
-            msg = MIMEMultipart()
-            msg["From"] = sender_email
-            msg["To"] = receiver_email
-            msg["Subject"] = subject
-            msg.attach(MIMEText(message, "plain"))
-
-            server = smtplib.SMTP("smtp.gmail.com", 587)
-            server.starttls()
-            server.login(sender_email, sender_password)
-            text = msg.as_string()
-            server.sendmail(sender_email, receiver_email, text)
-            server.quit()
-
-    class DealFinding:
-        def __init__(self, store, price, product_name, original_price=None, discount=None):
-            self.store = store
-            self.price = price
-            self.product_name = product_name
-            self.original_price = original_price
-            self.discount = discount
-            self.timestamp = datetime.now()
+# How result pages are fetched: 'http' (no browser), 'browser' (Playwright),
+# or 'auto' (HTTP first, browser when the page needs rendering).
+FETCHERS = ('auto', 'http', 'browser')
+SCRAPER_FETCHER = os.getenv("SCRAPER_FETCHER", "auto")
+# Wall-clock seconds one search may spend reading its results page, HTTP and
+# browser fallback together.
+SCRAPE_JOB_TIMEOUT = float(os.getenv("SCRAPE_JOB_TIMEOUT", "120"))
+
+# Reads every offer card of a results page in a single round-trip to the
+# browser; parsing and price filtering happen in Python afterwards.
+EXTRACT_CARDS_JS = """
+cards => cards.map(card => {
+    const text = selector => {
+        const element = card.querySelector(selector);
+        return element ? element.innerText.trim() : null;
+    };
+    return {
+        store: text('.card__subtitle'),
+        product_name: text('.card__title'),
+        price_text: text('.card__prices-main-price'),
+        original_price_text: text('.card__prices-strike-price, .card__prices-former-price, del, s')
+    };
+})
+"""
+
+
+class DealFinding:
+    def __init__(self, store, price, product_name, original_price=None, discount=None, message=None,
+                 unit_price=None, unit=None):
+        self.store = store
+        self.price = price
+        self.product_name = product_name
+        self.original_price = original_price
+        self.discount = discount
+        self.unit_price = unit_price
+        self.unit = unit
+        self.message = message
+        self.timestamp = datetime.now()
+
+
+def _price_details(finding):
+    details = []
+    if finding.original_price:
+        details.append(f"statt €{finding.original_price:.2f}")
+    if finding.discount:
+        details.append(f"-{finding.discount}%")
+    if finding.unit_price:
+        details.append(f"€{finding.unit_price:.2f}/{finding.unit}")
+    return f" ({', '.join(details)})" if details else ""
 
-    collected_findings = []
 
-    def format_email_content(findings):
-        email_content = f"""
-        🎯 Deal Alert Summary for {product}
-        📍 Location: {city}, {country}
-        💰 Target Price: €{target_price:.2f}
-        
-        Found Deals:
+def format_email_content(findings, product, city, country, target_price):
+    email_content = f"""
+    🎯 Deal Alert Summary for {product}
+    📍 Location: {city}, {country}
+    💰 Target Price: €{target_price:.2f}
+
+    Found Deals:
+    """
+    for finding in findings:
+        email_content += f"""
+        🏪 {finding.store}
+        📦 {finding.product_name}
+        💶 Current Price: €{finding.price:.2f}{_price_details(finding)}
+        ⏰ Found at: {finding.timestamp.strftime('%Y-%m-%d %H:%M:%S')}
+        {'=' * 50}
         """
-        for finding in findings:
-            email_content += f"""
-            🏪 {finding.store}
-            📦 {finding.product_name}
-            💶 Current Price: €{finding.price:.2f}
-            ⏰ Found at: {finding.timestamp.strftime('%Y-%m-%d %H:%M:%S')}
-            {'=' * 50}
-            """
-        return email_content
-
-    def log_deal(store, price, product_name, data):
-        for finding in collected_findings:
-            if (finding.store == store and finding.price == price and 
-                finding.product_name == product_name):
-                return
-
-        finding = DealFinding(store, price, product_name)
-        collected_findings.append(finding)
+    return email_content
 
-        existing_result = ScraperResult.query.filter_by(
-            store=store,
-            price=price,
-            product=product_name,
-            target_price=target_price,
-            city=city,
-            country=country,
-            user_id=user_id
-        ).first()
-
-        if not existing_result:
-            scraper_result = ScraperResult(
-                store=store,
-                price=price,
-                product=product_name,
-                target_price=target_price,
-                city=city,
-                country=country,
-                email_notification=should_send_email,
-                user_id=user_id,
-                data=data,
-                timestamp=finding.timestamp
-            )
-            db.session.add(scraper_result)
-            db.session.commit()
 
-    @dataclass
-    class Product:
-        name: str
-        target_price: float
+def build_search_url(product, lat, lng):
+    return SEARCH_URL.format(product=product, lat=lat, lng=lng)
+
+
+def scrape_cards(page, url, on_card=None, profile=None):
+    """Read every offer card on a results page as a dict.
+
+    Each card has store, product_name, price_text and original_price_text
+    (None when the card has no such field). on_card, if given, is called
+    with each card once the page has been read.
+    Only the offer grid is waited for, not the page's full load event.
+    """
+    logger.debug(f"Accessing URL: {url}")
+    with timed('navigation'):
+        page.goto(url, wait_until="commit")
+    with timed('selector_wait'):
+        page.wait_for_selector(OFFER_SECTION_SELECTOR, timeout=RESULTS_TIMEOUT)
+    if profile:
+        save_storage_state(page.context, profile)
+    with timed('extraction'):
+        cards = page.eval_on_selector_all(f"{OFFER_SECTION_SELECTOR} {OFFER_CARD_SELECTOR}", EXTRACT_CARDS_JS)
+    if on_card:
+        for card in cards:
+            on_card(card)
+    return cards
+
+
+def iter_cards(url, fetcher=None, timeout=SCRAPE_JOB_TIMEOUT):
+    """Yield the offer cards at url using the chosen fetcher backend.
+
+    timeout bounds the read in seconds, including a browser fallback;
+    TimeoutError is raised when it runs out.
+    """
+    fetcher = fetcher or SCRAPER_FETCHER
+    scrape_limiter.acquire()
+    deadline = time.monotonic() + timeout
+    if fetcher in ('auto', 'http'):
+        try:
+            yield from fetch_cards(url, timeout=min(HTTP_TIMEOUT, timeout))
+            return
+        except FetchError as e:
+            if fetcher == 'http':
+                raise
+            logger.info(f"HTTP fetch failed, falling back to browser: {str(e)}")
+            scrape_limiter.acquire()  # the browser page is a second request to the site
+
+    yield from browser_cards(url, timeout=max(0.0, deadline - time.monotonic()))
+
+
+def browser_cards(url, timeout=None):
+    """Yield the offer cards at url as a pooled browser reads them."""
+    pool = get_browser_pool()
+    # Page work runs on a pooled browser thread; cards are handed over as soon as the page is read
+    yield from pool.stream(lambda page, emit: scrape_cards(page, url, emit, pool.profile), timeout=timeout)
+
+
+def offer_prices(offers):
+    """(store, price) of every offer, for the price history."""
+    return [(offer.store, offer.price) for offer in offers]
+
+
+def deal_finding(offer, target_price):
+    message = f"Deal alert! {offer.store} offers {offer.product_name} for {offer.price_text}! (Target price: €{target_price:.2f})"
+    logger.info(message)
+    deals_found.inc()
+    return DealFinding(offer.store, offer.price, offer.product_name, original_price=offer.original_price,
+                       discount=offer.discount, unit_price=offer.unit_price, unit=offer.unit, message=message)
+
+
+def record_prices(product, lat, lng, cards):
+    """Add the prices of a freshly scraped page to the price history (the caller commits)."""
+    # Parsed as a whole so unreadable prices are counted and logged once per scraped page
+    record_observations(product, lat, lng, offer_prices(parse_offers(cards)))
+
 
-    PRODUCTS_AND_PRICES = [Product(product, float(target_price))]
-    results = []
+def iter_offer_cards(product, lat, lng, fetcher=None, timeout=SCRAPE_JOB_TIMEOUT, on_scraped=record_prices):
+    """Yield the offer cards for product near lat/lng, wherever they come from.
 
-    with sync_playwright() as p:
-        logger.info("Starting Playwright session")
-        browser = p.chromium.launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage', 
-                  '--disable-gpu', '--single-process']
+    Cards come from the offer cache, from a scrape of the same query that is
+    already running in this process, or from a new scrape. A new scrape's
+    cards are yielded as they are read, then cached, handed to the waiting
+    callers and passed to on_scraped(product, lat, lng, cards), which records
+    them in the price history by default. timeout bounds the scrape, or the
+    wait for someone else's, in seconds. This is the one place that
+    speaks the cache and single-flight protocol; the scrape engine and
+    iter_findings both read offers through it.
+    """
+    cards = get_offers(product, lat, lng)
+    if cards is not None:
+        yield from cards
+        return
+
+    key = cache_key(product, lat, lng)
+    flight, leader = inflight.begin(key)
+    if not leader:
+        # Someone else is scraping this query nearby right now; use their cards
+        logger.debug(f"Waiting for in-flight scrape of {key}")
+        yield from flight.wait(timeout)
+        return
+
+    cards = []
+    try:
+        for card in iter_cards(build_search_url(product, lat, lng), fetcher, timeout):
+            cards.append(card)
+            yield card
+    except BaseException as e:
+        inflight.finish(key, flight, error=e)
+        raise
+    put_offers(product, lat, lng, cards)
+    inflight.finish(key, flight, cards=cards)
+    on_scraped(product, lat, lng, cards)
+
+
+def _insert_new_deals(rows):
+    """Insert deal rows, skipping any whose fingerprint is already stored."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(ScraperResult).on_conflict_do_nothing(index_elements=['fingerprint'])
+        db.session.execute(stmt, rows)
+        return
+
+    existing = set(db.session.scalars(select(ScraperResult.fingerprint).where(
+        ScraperResult.fingerprint.in_([row['fingerprint'] for row in rows])
+    )))
+    rows = [row for row in rows if row['fingerprint'] not in existing]
+    if rows:
+        db.session.execute(insert(ScraperResult), rows)
+
+
+def record_deals(findings, product, target_price, city, country, should_send_email, user_id=None):
+    """Store new deals, queue the summary email and return them as dicts.
+
+    All findings of a run are written in a single transaction: duplicates
+    within the run are dropped with a set and the rest go in as one bulk
+    insert that skips deals already stored under the same fingerprint. The
+    summary email joins the notification outbox in the same transaction.
+    """
+    collected_findings = []
+    rows = []
+    seen = set()
+    for finding in findings:
+        fingerprint = ScraperResult.make_fingerprint(
+            user_id, finding.store, finding.price, finding.product_name, target_price, city, country
         )
-        logger.debug("Browser launched successfully")
-        
-        page = browser.new_page()
-        logger.debug("New page created")
-
-        for item in PRODUCTS_AND_PRICES:
-            product = item.name
-            target_price = item.target_price
-            url = f"https://www.meinprospekt.de/webapp/?query={product}&lat={my_lat}&lng={my_long}"
-            logger.debug(f"Accessing URL: {url}")
-
-            try:
-                page.goto(url)
-                page.wait_for_load_state("load", timeout=10000)
-                offer_section = page.wait_for_selector(".search-group-grid-content", timeout=10000)
-                
-                if not offer_section:
-                    output = f"No Product {product} found"
-                else:
-                    products = offer_section.query_selector_all(".card.card--offer.slider-preventClick")
-                    output = ""
-                    
-                    for product_element in products:
-                        store_element = product_element.query_selector(".card__subtitle")
-                        price_element = product_element.query_selector(".card__prices-main-price")
-                        
-                        if store_element and price_element:
-                            store = store_element.inner_text().strip()
-                            price_text = price_element.inner_text().strip()
-                            
-                            try:
-                                price_value = float(price_text.replace("€", "").replace(",", ".").strip())
-                                if price_value <= target_price:
-                                    product_name_element = product_element.query_selector(".card__title")
-                                    product_name = product_name_element.inner_text().strip() if product_name_element else "Unknown Product"
-                                    
-                                    message = f"Deal alert! {store} offers {product_name} for {price_text}! (Target price: €{target_price:.2f})"
-                                    log_deal(store, price_value, product_name, message)
-                                    output += message + "\n"
-                            except ValueError:
-                                logger.error(f"Could not convert price to float: {price_text}")
-                
-                logger.info(output)
-                results.append(output)
-                
-            except PlaywrightTimeoutError as e:
-                logger.error(f"Timeout for {product}: {str(e)}")
-                continue
-            except Exception as e:
-                logger.error(f"Error processing {product}: {str(e)}")
-                continue
-
-        browser.close()
-        logger.info("Browser closed successfully")
-
-    if collected_findings and should_send_email:
-        email_content = format_email_content(collected_findings)
-        subject = f"Deal Alert Summary - {len(collected_findings)} deals found for {product}!"
-        send_email(subject, email_content, should_send_email)
-
-    formatted_results = []
-    for finding in collected_findings:
-        formatted_deal = {
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        collected_findings.append(finding)
+        rows.append({
             'store': finding.store,
-            'product_name': finding.product_name,
             'price': finding.price,
+            'product': finding.product_name,
+            'target_price': target_price,
+            'city': city,
+            'country': country,
+            'email_notification': should_send_email,
+            'user_id': user_id,
+            'data': finding.message,
             'timestamp': finding.timestamp,
-            'target_price': target_price
-        }
-        formatted_results.append(formatted_deal)
+            'fingerprint': fingerprint
+        })
+
+    if rows:
+        with timed('db_write'):
+            _insert_new_deals(rows)
+            if user_id is not None:
+                bump_deals_version(user_id)
+            if should_send_email:
+                email_content = format_email_content(collected_findings, product, city, country, target_price)
+                subject = f"Deal Alert Summary - {len(collected_findings)} deals found for {product}!"
+                queue_notification(user_id, subject, email_content)
+            db.session.commit()
+        logger.debug(f"Stored deals for {product} ({len(rows)} candidates)")
+
+    return [deal_dict(finding, target_price) for finding in collected_findings]
+
+
+def deal_dict(finding, target_price):
+    """A DealFinding as stored in SearchJob.results and sent to the browser."""
+    return {
+        'store': finding.store,
+        'product_name': finding.product_name,
+        'price': finding.price,
+        'timestamp': finding.timestamp,
+        'target_price': target_price
+    }
+
+
+def iter_findings(product, target_price, lat, lng, fetcher=None):
+    """Yield DealFindings one by one as the offer cards are read.
+
+    Nothing is stored here; callers collect the findings and pass them to
+    record_deals once the scrape is over.
+    """
+    target_price = float(target_price)
+    for card in iter_offer_cards(product, lat, lng, fetcher):
+        offer = parse_offer(card)
+        if offer is not None and offer.price <= target_price:
+            yield deal_finding(offer, target_price)
+
+
+def _log_scrape_error(product, e):
+    if is_timeout_error(e):
+        logger.error(f"Timeout for {product}: {str(e)}")
+        scrape_timeouts.inc()
+    else:
+        logger.error(f"Error processing {product}: {str(e)}")
+        scrape_errors.inc()
+
+
+def scrape_deals(city, country, product, target_price, should_send_email, user_id=None, lat=None, lng=None,
+                 fetcher=None, on_finding=None):
+    """Scrape one search, store its deals and return them as dicts.
+
+    Errors are logged and counted, then raised, so a queued job is failed
+    and retried instead of completing with no deals. on_finding, if given,
+    is called with each DealFinding as soon as it is read.
+    """
+    logger.info(f"Starting scraper for {product} in {city}, {country}")
+    # Get location coordinates, unless the caller already has them stored
+    if lat is None or lng is None:
+        loc = geocode(f"{city},{country}")
+        if loc is None:
+            raise LookupError(f"Could not geocode {city}, {country}")
+        lat, lng = loc.latitude, loc.longitude
+    logger.debug(f"Coordinates found - Latitude: {lat}, Longitude: {lng}")
+
+    findings = []
+    try:
+        for finding in iter_findings(product, target_price, lat, lng, fetcher):
+            findings.append(finding)
+            if on_finding is not None:
+                on_finding(finding)
+    except Exception as e:
+        _log_scrape_error(product, e)
+        raise
+    return record_deals(findings, product, float(target_price), city, country, should_send_email, user_id)
 
-    return formatted_results
@@ -7,16 +7,109 @@ function deleteNote(noteId) {
   });
 }
 
-function updateDealsList() {
-    fetch('/get-deals')
+function renderPreviousDeal(deal, deleteUrl) {
+    const col = document.createElement('div');
+    col.className = 'col-md-3 mb-3';
+    col.dataset.dealId = deal.id;
+    col.innerHTML = `
+        <div class="card h-100 shadow-sm hover-effect border-0">
+            <div class="card-header bg-light d-flex justify-content-between align-items-center py-2">
+                <div class="text-muted small"><i class="fas fa-store me-1"></i><span class="deal-store"></span></div>
+                <form action="${deleteUrl}" method="POST" class="d-inline">
+                    <input type="hidden" name="deal_id" value="${deal.id}">
+                    <button type="submit" class="btn btn-link btn-sm text-muted p-0"><i class="fas fa-trash"></i></button>
+                </form>
+            </div>
+            <div class="card-body p-3">
+                <h6 class="card-title text-truncate mb-3 deal-product"></h6>
+                <div class="small">
+                    <p class="mb-1">Current: €${(deal.price || 0).toFixed(2)}</p>
+                    <p class="mb-2">Target: €${(deal.target_price || 0).toFixed(2)}</p>
+                    <span class="text-muted smaller"><i class="far fa-clock me-1"></i><span class="deal-date"></span></span>
+                </div>
+            </div>
+        </div>`;
+    col.querySelector('.deal-store').textContent = deal.store || 'Unknown Store';
+    col.querySelector('.deal-product').textContent = deal.product || 'Unknown Product';
+    if (deal.date_created) {
+        col.querySelector('.deal-date').textContent = window.moment ? moment(deal.date_created).fromNow() : deal.date_created;
+    }
+    return col;
+}
+
+function showLoadMore(nextCursor) {
+    document.getElementById('previousDeals').dataset.nextCursor = nextCursor || '';
+    document.getElementById('loadMoreDeals').classList.toggle('d-none', !nextCursor);
+}
+
+// Append the page of older deals that starts after cursor
+function fetchDeals(cursor) {
+    const container = document.getElementById('previousDeals');
+    const params = new URLSearchParams({cursor: cursor});
+    fetch(container.dataset.dealsUrl + '?' + params.toString())
         .then(response => response.json())
-        .then(deals => {
-            const dealsContainer = document.querySelector('.row-cols-1');
-            // Update deals display
-            renderDeals(deals);
+        .then(page => {
+            page.deals.forEach(deal => container.appendChild(renderPreviousDeal(deal, container.dataset.deleteUrl)));
+            showLoadMore(page.next_cursor);
+        });
+}
+
+function replaceDeals(container, page) {
+    container.innerHTML = '';
+    page.deals.forEach(deal => container.appendChild(renderPreviousDeal(deal, container.dataset.deleteUrl)));
+    container.dataset.version = page.version;
+    container.dataset.sinceId = page.deals.length ? page.deals[0].id : 0;
+    showLoadMore(page.next_cursor);
+}
+
+// Ask only for what changed since the last poll; an unchanged list costs a 304
+function updateDealsList() {
+    const container = document.getElementById('previousDeals');
+    if (!container) {
+        return;
+    }
+    const version = container.dataset.version;
+    const params = new URLSearchParams({since_version: version, since_id: container.dataset.sinceId});
+    fetch(container.dataset.dealsUrl + '?' + params.toString(), {
+        cache: 'no-store',
+        headers: {'If-None-Match': `"deals-${version}"`}
+    })
+        .then(response => response.status === 304 ? null : response.json())
+        .then(delta => {
+            if (!delta) {
+                return;
+            }
+            if (delta.reset) {
+                replaceDeals(container, delta);
+                return;
+            }
+            delta.deleted.forEach(id => {
+                const card = container.querySelector(`[data-deal-id="${id}"]`);
+                if (card) {
+                    card.remove();
+                }
+            });
+            delta.deals.slice().reverse().forEach(deal => {
+                if (!container.querySelector(`[data-deal-id="${deal.id}"]`)) {
+                    container.prepend(renderPreviousDeal(deal, container.dataset.deleteUrl));
+                }
+            });
+            if (delta.deals.length) {
+                container.dataset.sinceId = Math.max(container.dataset.sinceId, delta.deals[0].id);
+            }
+            container.dataset.version = delta.version;
         });
 }
 
+document.addEventListener('DOMContentLoaded', function() {
+    const loadMore = document.getElementById('loadMoreDeals');
+    if (loadMore) {
+        loadMore.addEventListener('click', function() {
+            fetchDeals(document.getElementById('previousDeals').dataset.nextCursor);
+        });
+    }
+});
+
 setInterval(updateDealsList, 300000); // Update every 5 minutes
 
 document.addEventListener('DOMContentLoaded', function() {
@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+import logging
+import time
+import os
+from sqlalchemy import select
+from . import scheduler, db
+from .models import SavedSearch, ScraperSchedule
+from .scrapper import record_deals
+from .geocoding import resolve_coordinates
+from .scrape_engine import ScrapeJob, run_jobs
+from .notifications import dispatch_pending, NOTIFY_INTERVAL
+from .metrics import traced, scheduler_tick_seconds, scheduler_batch_seconds, scheduler_lag_seconds, scheduler_due_searches
+
+logger = logging.getLogger(__name__)
+
+# Scheduled scrapes run on a bounded worker pool so the APScheduler thread
+# only picks due searches and hands them off; a slow page no longer blocks
+# the tick, and a search still running is skipped instead of started twice.
+SCHEDULER_MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", "4"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "10"))
+# A saved search whose scrape failed is tried again after this delay instead
+# of waiting for its next period.
+SCHEDULE_RETRY_DELAY = int(os.getenv("SCHEDULE_RETRY_DELAY", "900"))  # seconds
+# A ScraperSchedule run missed by up to this much (e.g. a busy scheduler
+# thread) is still fired late by APScheduler. Runs missed by more, e.g. while
+# no worker was up, are caught up by sync_schedules from the schedule's
+# next_run; the two never cover the same run.
+SCHEDULE_MISFIRE_GRACE = int(os.getenv("SCHEDULE_MISFIRE_GRACE", "3600"))  # seconds
+
+_executor = ThreadPoolExecutor(max_workers=SCHEDULER_MAX_WORKERS, thread_name_prefix="scheduled-search")
+_running_searches = set()
+_running_lock = threading.Lock()
+
+@scheduler.task('interval', id='check_scheduled_searches', minutes=1, max_instances=1, coalesce=True)
+def check_scheduled_searches():
+    with scheduler.app.app_context():
+        run_due_searches(datetime.now())
+
+@scheduler.task('interval', id='dispatch_notifications', seconds=NOTIFY_INTERVAL, max_instances=1, coalesce=True)
+def dispatch_notifications():
+    with scheduler.app.app_context():
+        try:
+            dispatch_pending()
+        except Exception as e:
+            logger.error(f"Notification dispatch failed: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+@scheduler.task('interval', id='sync_schedules', minutes=1, max_instances=1, coalesce=True)
+def sync_schedules():
+    """Keep one daily cron job per active ScraperSchedule; the web tier only edits the rows.
+
+    Schedules whose next_run passed more than SCHEDULE_MISFIRE_GRACE ago
+    without a run (the worker was down at their slot) are run once now.
+    """
+    from .views import scheduled_job, schedule_slot
+
+    with scheduler.app.app_context():
+        rows = db.session.execute(
+            select(ScraperSchedule.id, ScraperSchedule.next_run).where(ScraperSchedule.active.is_(True))
+        ).all()
+        db.session.remove()
+    active = {f'schedule_{row.id}': row.id for row in rows}
+    overdue_before = datetime.now() - timedelta(seconds=SCHEDULE_MISFIRE_GRACE)
+    for row in rows:
+        if row.next_run is not None and row.next_run < overdue_before:
+            logger.info(f"Catching up on missed run of schedule {row.id} (due {row.next_run})")
+            try:
+                scheduled_job(row.id, scheduler.app)
+            except Exception as e:
+                logger.error(f"Could not catch up on schedule {row.id}: {str(e)}")
+
+    registered = {job.id for job in scheduler.get_jobs() if job.id.startswith('schedule_')}
+    for job_id in registered - active.keys():
+        scheduler.remove_job(job_id)
+    for job_id in active.keys() - registered:
+        schedule_time = schedule_slot(active[job_id])
+        scheduler.add_job(
+            func=scheduled_job,
+            args=[active[job_id], scheduler.app],
+            trigger='cron',
+            hour=schedule_time.hour,
+            minute=schedule_time.minute,
+            id=job_id,
+            misfire_grace_time=SCHEDULE_MISFIRE_GRACE,
+            coalesce=True,
+            replace_existing=True
+        )
+
+def run_due_searches(current_time):
+    """Hand every saved search whose next_run_at has passed to the worker pool.
+
+    Only due rows are loaded (an index seek on next_run_at); running a
+    search or expiring it moves next_run_at forward via the model hooks.
+    Returns the ids that were dispatched.
+    """
+    started = time.perf_counter()
+    searches = SavedSearch.query.filter(
+        SavedSearch.next_run_at <= current_time
+    ).order_by(SavedSearch.next_run_at).all()
+    scheduler_due_searches.set(len(searches))
+    scheduler_lag_seconds.set((current_time - searches[0].next_run_at).total_seconds() if searches else 0)
+    due_ids = []
+
+    for search in searches:
+        # Check if search has exceeded its duration
+        if search.duration and search.date_created:
+            time_elapsed = (current_time - search.date_created).total_seconds() / 60
+            if time_elapsed >= search.duration:
+                search.schedule_type = None  # Deactivate schedule
+                continue
+        due_ids.append(search.id)
+
+    db.session.commit()
+
+    with _running_lock:
+        skipped = [search_id for search_id in due_ids if search_id in _running_searches]
+        due_ids = [search_id for search_id in due_ids if search_id not in _running_searches]
+        _running_searches.update(due_ids)
+    if skipped:
+        logger.info(f"Skipping searches still running: {skipped}")
+
+    app = scheduler.app
+    for start in range(0, len(due_ids), SCHEDULER_BATCH_SIZE):
+        batch = due_ids[start:start + SCHEDULER_BATCH_SIZE]
+        future = _executor.submit(_run_batch, app, batch)
+        future.add_done_callback(lambda _, batch=batch: _release(batch))
+    scheduler_tick_seconds.observe(time.perf_counter() - started)
+    return due_ids
+
+def _release(search_ids):
+    with _running_lock:
+        _running_searches.difference_update(search_ids)
+
+def _run_batch(app, search_ids):
+    started = time.perf_counter()
+    with app.app_context(), traced(f"scheduled batch {search_ids}"):
+        try:
+            searches = SavedSearch.query.filter(SavedSearch.id.in_(search_ids)).all()
+            run_scheduled_searches(searches)
+        except Exception as e:
+            logger.error(f"Scheduled batch {search_ids} failed: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+            scheduler_batch_seconds.observe(time.perf_counter() - started)
+
+def run_scheduled_searches(searches):
+    """Scrape all due searches as one concurrent batch and store their deals.
+
+    last_run only moves on success; a search that could not be scraped is
+    due again after SCHEDULE_RETRY_DELAY.
+    """
+    jobs = []
+    for search in searches:
+        coordinates = resolve_coordinates(search)
+        if coordinates is None:
+            logger.error(f"No location found for search {search.id}: {search.city}, {search.country}")
+            _retry_later(search)
+            continue
+        lat, lng = coordinates
+        jobs.append(ScrapeJob(search.product, float(search.target_price), lat, lng, tag=search, fetcher=search.fetcher))
+
+    if not jobs:
+        db.session.commit()
+        return
+
+    for result in run_jobs(jobs):
+        search = result.job.tag
+        if result.ok:
+            record_deals(
+                result.findings,
+                product=search.product,
+                target_price=float(search.target_price),
+                city=search.city,
+                country=search.country,
+                should_send_email=search.email_notification,
+                user_id=search.user_id
+            )
+            search.last_run = datetime.now()
+        else:
+            _retry_later(search)
+    db.session.commit()
+
+def _retry_later(search):
+    # Only next_run_at changes, so the model hooks leave it alone
+    search.next_run_at = datetime.now() + timedelta(seconds=SCHEDULE_RETRY_DELAY)
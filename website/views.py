@@ -1,39 +1,76 @@
 from flask import Blueprint, render_template, request, flash, jsonify
 from flask_login import login_required, current_user
-from .models import Note, ScraperResult, SavedSearch, ScraperSchedule
+from .models import (Note, ScraperResult, SavedSearch, ScraperSchedule, SearchJob, DeletedDeal, schedule_jitter,
+                     bump_deals_version)
 from . import db
-from .scrapper import run_scraper
-from geopy.exc import GeocoderTimedOut
-from geopy.geocoders import Nominatim
-import time
+from .job_queue import enqueue
+from .geocoding import geocode
+from .price_history import lowest_price, daily_trend
 import datetime
 import json
+import time
+import os
 from flask import redirect, url_for
 from io import StringIO
 import csv
-from flask import make_response
+from flask import make_response, Response, stream_with_context
 from flask import json
-from . import scheduler
 from .models import User
+from sqlalchemy import select, tuple_
 
 views = Blueprint('views', __name__)
 # Global schedule time settings
 SCHEDULE_HOUR = 7  # Default 7 AM
 SCHEDULE_MINUTE = 0  # Default 0 minutes
 
+def schedule_slot(schedule_id):
+    """Daily run time of a ScraperSchedule: the global slot plus its own jitter."""
+    slot = datetime.datetime.combine(datetime.date.today(), datetime.time(SCHEDULE_HOUR, SCHEDULE_MINUTE))
+    return (slot + schedule_jitter(f"schedule:{schedule_id}")).time()
+
+SEARCH_STREAM_POLL = float(os.getenv("SEARCH_STREAM_POLL", "0.5"))  # seconds
+SEARCH_STREAM_TIMEOUT = float(os.getenv("SEARCH_STREAM_TIMEOUT", "120"))  # seconds
+
+DEALS_PAGE_SIZE = 24
+DEALS_MAX_PAGE_SIZE = 100
+DEAL_COLUMNS = (ScraperResult.id, ScraperResult.store, ScraperResult.product, ScraperResult.price,
+                ScraperResult.target_price, ScraperResult.date_created)
+
+def user_deals_page(user_id, cursor=None, limit=DEALS_PAGE_SIZE):
+    """A page of the user's deals, newest first, and the cursor for the next one.
+
+    Keyset pagination on id: the cursor is the last id already shown, so every
+    page is one seek on the (user_id, id) index however many deals exist.
+    """
+    query = db.session.query(*DEAL_COLUMNS).filter(ScraperResult.user_id == user_id)
+    if cursor:
+        query = query.filter(ScraperResult.id < int(cursor))
+    rows = query.order_by(ScraperResult.id.desc()).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def deal_to_dict(row):
+    created = row.date_created
+    if created is not None:
+        # date_created is stored in UTC
+        created = created.isoformat() + ('Z' if created.tzinfo is None else '')
+    return {
+        'id': row.id,
+        'store': row.store,
+        'product': row.product,
+        'price': row.price,
+        'target_price': row.target_price,
+        'date_created': created
+    }
+
+def _page_size():
+    return max(1, min(request.args.get('limit', DEALS_PAGE_SIZE, type=int), DEALS_MAX_PAGE_SIZE))
+
 def geocode_with_retry(location_string, max_attempts=5, initial_delay=1):
-    geolocator = Nominatim(user_agent="FindmyPrize_Flask", timeout=10)
-    
-    for attempt in range(max_attempts):
-        try:
-            location = geolocator.geocode(location_string)
-            if location:
-                return location
-        except GeocoderTimedOut:
-            delay = initial_delay * (2 ** attempt)  # Exponential backoff
-            time.sleep(delay)
-            continue
-    
+    location = geocode(location_string, max_attempts=max_attempts, initial_delay=initial_delay)
+    if location:
+        return location
+
     flash(f'Location service temporarily unavailable. Please try again.', category='error')
     return None
 
@@ -47,17 +84,22 @@ def home():
     # Load saved searches for the user
     saved_searches = SavedSearch.query.filter_by(user_id=current_user.id).order_by(SavedSearch.date_created.desc()).first()
     
-    # Modify this line to include all necessary fields for the deals cards
-    saved_deals = ScraperResult.query.filter_by(user_id=current_user.id).order_by(ScraperResult.id.desc()).all()
+    # First page only; the rest is fetched from /get-deals
+    saved_deals, next_cursor = user_deals_page(current_user.id)
     
     if request.method == 'POST':
+        from .scrapper import FETCHERS
+
         product = request.form.get('product')
         price = request.form.get('price').replace(',', '.')
         save_search = request.form.get('saveSearch') == 'on'
         email_notification = request.form.get('emailNotification') == 'on'
+        fetcher = request.form.get('fetcher') if request.form.get('fetcher') in FETCHERS else None
 
         if city and country and product and price:
             print(f"Received POST request with product: {product}, price: {price}, city: {city}, country: {country}")
+            # Unknown coordinates are geocoded by the worker, not in the request
+            lat, lng = current_user.latitude, current_user.longitude
             if save_search:
                 saved_search = SavedSearch(
                     user_id=current_user.id,
@@ -65,41 +107,114 @@ def home():
                     target_price=float(price),
                     city=city,
                     country=country,
-                    email_notification=email_notification
+                    latitude=lat,
+                    longitude=lng,
+                    email_notification=email_notification,
+                    fetcher=fetcher
                 )
                 db.session.add(saved_search)
-                db.session.commit()
+            db.session.commit()
             
-            results = run_scraper(city, country, product, float(price), email_notification)
-            # Results are now properly structured dictionaries
-            if results:
-                for result in results:
-                    scraper_result = ScraperResult(
-                        store=result['store'],
-                        price=result['price'],
-                        product=result['product_name'],
-                        target_price=float(price),
-                        city=city,
-                        country=country,
-                        email_notification=email_notification,
-                        user_id=current_user.id,
-                        data=json.dumps(result)
-                    )
-                    db.session.add(scraper_result)
-                db.session.commit()
-            
-            return render_template('home.html',
-                user=current_user,
-                results=results,
-                saved_searches=saved_searches,
-                deals=saved_deals,
-                is_previous_deal=True)  # Add this flag to differentiate styling
+            # The scrape runs in a worker process; the page polls the job
+            job = enqueue(current_user.id, product, float(price), city, country, email_notification,
+                          lat=lat, lng=lng, fetcher=fetcher)
+            return redirect(url_for('views.home', job=job.id))
+
+    job = None
+    results = None
+    job_id = request.args.get('job', type=int)
+    if job_id:
+        job = SearchJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+        if job and job.results:
+            results = json.loads(job.results)
 
     return render_template('home.html',
         user=current_user,
         deals=saved_deals,
+        next_cursor=next_cursor,
         saved_search=saved_searches,
+        job=job,
+        results=results,
         is_previous_deal=True)  # Add this flag to differentiate styling
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@views.route('/search', methods=['POST'])
+@login_required
+def queue_search():
+    """Queue a search from the search form and return where to follow it."""
+    from .scrapper import FETCHERS
+
+    product = request.form.get('product')
+    price = (request.form.get('price') or '').replace(',', '.')
+    email_notification = request.form.get('emailNotification') == 'on'
+    fetcher = request.form.get('fetcher') if request.form.get('fetcher') in FETCHERS else None
+    city = current_user.city
+    country = current_user.country
+    if not (city and country and product and price):
+        return jsonify({'error': 'product, price and a user location are required'}), 400
+
+    job = enqueue(current_user.id, product, float(price), city, country, email_notification,
+                  lat=current_user.latitude, lng=current_user.longitude, fetcher=fetcher)
+    return jsonify({
+        'job_id': job.id,
+        'stream_url': url_for('views.stream_search', job_id=job.id),
+        'status_url': url_for('views.job_status', job_id=job.id)
+    }), 202
+
+@views.route('/search/stream/<int:job_id>')
+@login_required
+def stream_search(job_id):
+    """Stream the deals of a queued search as Server-Sent Events while a worker runs it.
+
+    Only reads the job row, so reconnecting or reloading never queues
+    another scrape: deals the worker has saved so far are sent as they
+    appear, then 'done' or 'failed'. After SEARCH_STREAM_TIMEOUT a 'pending'
+    event hands over to polling /jobs/<id>.
+    """
+    SearchJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    status_url = url_for('views.job_status', job_id=job_id)
+
+    def generate():
+        sent = set()
+        deadline = time.monotonic() + SEARCH_STREAM_TIMEOUT
+        while True:
+            row = db.session.execute(
+                select(SearchJob.status, SearchJob.results, SearchJob.error).where(SearchJob.id == job_id)
+            ).one()
+            # End the read transaction so the next poll sees what the worker committed since
+            db.session.commit()
+            for deal in json.loads(row.results) if row.results else []:
+                key = (deal['store'], deal['product_name'], deal['price'])
+                if key not in sent:
+                    sent.add(key)
+                    yield _sse('deal', deal)
+            if row.status == 'done':
+                yield _sse('done', {'count': len(sent)})
+                return
+            if row.status == 'failed':
+                yield _sse('failed', {'error': row.error})
+                return
+            if time.monotonic() >= deadline:
+                yield _sse('pending', {'job_id': job_id, 'status_url': status_url})
+                return
+            time.sleep(SEARCH_STREAM_POLL)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@views.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = SearchJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify({
+        'id': job.id,
+        'status': job.status,
+        'error': job.error,
+        'results': json.loads(job.results) if job.results else []
+    })
+
 @views.route('/delete-note', methods=['POST'])
 def delete_note():  
      note = json.loads(request.data) # this function expects a JSON from the INDEX.js file 
@@ -126,12 +241,15 @@ def handle_geocoding():
         city = location.address.split(',')[0]  # Extract city from geocoded address
         country = location.address.split(',')[-1]  # Extract country from geocoded address
         
-        scraper_results = run_scraper(
-            city=city,
-            country=country,
-            product=product,
-            target_price=float(target_price),
-            should_send_email=email_notification
+        job = enqueue(
+            current_user.id,
+            product,
+            float(target_price),
+            city,
+            country,
+            email_notification,
+            lat=location.latitude,
+            lng=location.longitude
         )
         
         scraper_result = ScraperResult(
@@ -139,22 +257,123 @@ def handle_geocoding():
             user_id=current_user.id
         )
         db.session.add(scraper_result)
+        bump_deals_version(current_user.id)
         db.session.commit()
         
         return jsonify({
             'latitude': location.latitude,
             'longitude': location.longitude,
             'address': location.address,
-            'scraper_results': scraper_results
-        })
+            'job_id': job.id,
+            'status_url': url_for('views.job_status', job_id=job.id)
+        }), 202
     else:
         return jsonify({'error': 'Geocoding failed'}), 500
 # Add other existing view functions here     return jsonify({})
 
+def _deals_etag(version):
+    return f"deals-{version or 0}"
+
+@views.route('/get-deals')
+@login_required
+def get_deals():
+    """Deals for the poller in index.js.
+
+    Without since_version this returns a page like the home page (cursor for
+    the next one). With since_version and since_id it returns only the deals
+    added after since_id and the ids deleted after since_version, or
+    reset=True and the first page when the client is too far behind.
+    An If-None-Match matching the current version gets a 304 without any
+    query beyond loading the user.
+    """
+    version = current_user.deals_version or 0
+    etag = _deals_etag(version)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        try:
+            payload = _deals_delta(version)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _deals_delta(version):
+    since_version = request.args.get('since_version', type=int)
+    since_id = request.args.get('since_id', 0, type=int)
+    limit = _page_size()
+    payload = {'version': version, 'reset': False, 'deleted': []}
+    if since_version is None or since_version < (current_user.deals_reset_version or 0):
+        deals, payload['next_cursor'] = user_deals_page(current_user.id, request.args.get('cursor'), limit)
+        payload['reset'] = since_version is not None
+    else:
+        deals = db.session.query(*DEAL_COLUMNS).filter(
+            ScraperResult.user_id == current_user.id, ScraperResult.id > since_id
+        ).order_by(ScraperResult.id.desc()).limit(limit + 1).all()
+        if len(deals) > limit:
+            # Too many new deals for one delta; start over from the newest page
+            deals, payload['next_cursor'] = user_deals_page(current_user.id, None, limit)
+            payload['reset'] = True
+        else:
+            payload['deleted'] = [deal_id for deal_id, in db.session.query(DeletedDeal.deal_id).filter(
+                DeletedDeal.user_id == current_user.id, DeletedDeal.version > since_version
+            )]
+    payload['deals'] = [deal_to_dict(deal) for deal in deals]
+    return payload
+
+@views.route('/price-history')
+@login_required
+def price_history():
+    """Price trend of a product: lowest price and daily min/avg/max over ?days= (default 90).
+
+    ?store= limits it to one store; ?nearby=1 to the user's own location cell,
+    which needs coordinates stored by an earlier search (400 otherwise).
+    """
+    product = request.args.get('product')
+    if not product:
+        return jsonify({'error': 'product is required'}), 400
+    days = max(1, min(request.args.get('days', 90, type=int), 3650))
+    store = request.args.get('store')
+    lat = lng = None
+    if request.args.get('nearby') == '1':
+        lat, lng = current_user.latitude, current_user.longitude
+        if lat is None or lng is None:
+            return jsonify({'error': 'nearby needs a location; run a search first so it can be geocoded'}), 400
+
+    lowest = lowest_price(product, days, store, lat, lng)
+    return jsonify({
+        'product': product,
+        'days': days,
+        'lowest': {'price': lowest.min_price, 'store': lowest.store, 'day': lowest.day.isoformat()} if lowest else None,
+        'daily': [{
+            'day': row.day.isoformat(),
+            'min': row.min_price,
+            'avg': round(row.avg_price, 2),
+            'max': row.max_price,
+            'observations': row.observations
+        } for row in daily_trend(product, days, store, lat, lng)]
+    })
+
 @views.route('/past-results')
 def past_results():
-    results = ScraperResult.query.order_by(ScraperResult.price.asc()).all()
-    return jsonify([{'data': json.loads(result.data), 'date': result.date} for result in results])
+    """All deals, cheapest first, paginated on (price, id); cursor is "price:id"."""
+    limit = _page_size()
+    query = db.session.query(*DEAL_COLUMNS, ScraperResult.data).filter(ScraperResult.price.is_not(None))
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            price, last_id = cursor.split(':')
+            query = query.filter(tuple_(ScraperResult.price, ScraperResult.id) > (float(price), int(last_id)))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    rows = query.order_by(ScraperResult.price.asc(), ScraperResult.id.asc()).limit(limit + 1).all()
+    next_cursor = f"{rows[limit - 1].price!r}:{rows[limit - 1].id}" if len(rows) > limit else None
+    return jsonify({
+        'results': [dict(deal_to_dict(row), data=row.data) for row in rows[:limit]],
+        'next_cursor': next_cursor
+    })
 
 
 @views.app_template_filter('from_json')
@@ -168,6 +387,9 @@ def from_json(value):
 @login_required
 def clear_deals():
     ScraperResult.query.filter_by(user_id=current_user.id).delete()
+    # Pollers reload after a reset, so single-deal tombstones are no longer needed
+    DeletedDeal.query.filter_by(user_id=current_user.id).delete()
+    bump_deals_version(current_user.id, reset=True)
     db.session.commit()
     flash('All deals cleared successfully!', category='success')
     return redirect(url_for('views.home'))
@@ -179,24 +401,77 @@ def delete_deal():
     
     if deal and deal.user_id == current_user.id:
         db.session.delete(deal)
+        db.session.add(DeletedDeal(user_id=current_user.id, deal_id=deal.id,
+                                   version=bump_deals_version(current_user.id)))
         db.session.commit()
         flash('Deal deleted successfully!', 'success')
     
     return redirect(url_for('views.home'))
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = (ScraperResult.id, ScraperResult.date_created, ScraperResult.data, ScraperResult.store,
+                  ScraperResult.product, ScraperResult.price, ScraperResult.target_price,
+                  ScraperResult.city, ScraperResult.country)
+EXPORT_HEADERS = ['ID', 'Date', 'Data', 'Store', 'Product', 'Price', 'Target Price', 'City', 'Country']
+
+def _export_rows(user_id, start, end):
+    query = select(*EXPORT_COLUMNS).where(ScraperResult.user_id == user_id)
+    if start:
+        query = query.where(ScraperResult.date_created >= start)
+    if end:
+        query = query.where(ScraperResult.date_created < end)
+    # yield_per streams rows from the cursor in batches instead of loading them all
+    query = query.order_by(ScraperResult.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    return db.session.execute(query)
+
+def _export_csv(rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _export_jsonl(rows):
+    chunk = []
+    for row in rows:
+        record = dict(zip(EXPORT_HEADERS, row))
+        record['Date'] = record['Date'].isoformat() if record['Date'] else None
+        chunk.append(json.dumps(record) + '\n')
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk)
+
 @views.route('/export-deals')
+@login_required
 def export_deals():
-    deals = ScraperResult.query.all()
-    si = StringIO()
-    cw = csv.writer(si)
-    cw.writerow(['ID', 'Date', 'Data'])  # Headers
-    for deal in deals:
-        cw.writerow([deal.id, deal.date_created, deal.data])
-    
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=deals_export.csv"
-    output.headers["Content-type"] = "text/csv"
-    return output
+    """Stream the user's deals as CSV (default) or JSON Lines (?format=jsonl).
+
+    ?from= and ?to= (YYYY-MM-DD, both inclusive) limit the date range.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    try:
+        start = request.args.get('from')
+        start = datetime.datetime.strptime(start, '%Y-%m-%d') if start else None
+        end = request.args.get('to')
+        end = datetime.datetime.strptime(end, '%Y-%m-%d') + datetime.timedelta(days=1) if end else None
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+
+    rows = _export_rows(current_user.id, start, end)
+    if export_format == 'jsonl':
+        body, mimetype, filename = _export_jsonl(rows), 'application/x-ndjson', 'deals_export.jsonl'
+    else:
+        body, mimetype, filename = _export_csv(rows), 'text/csv', 'deals_export.csv'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 
 
@@ -204,7 +479,7 @@ def export_deals():
 @login_required
 def scheduler_status():
     schedules = ScraperSchedule.query.filter_by(user_id=current_user.id).all()
-    active_jobs = scheduler.get_jobs()
+    active_jobs = [schedule for schedule in schedules if schedule.active]
     
     # Add flash message to show counts
     flash(f'Found {len(schedules)} schedules and {len(active_jobs)} active jobs', category='info')
@@ -253,50 +528,30 @@ def cancel_schedule(schedule_id):
                  schedule.active = False
                  db.session.commit()
     
-                 # Try to remove from scheduler if job exists
-                 job_id = f'schedule_{schedule_id}'
-                 if job_id in [job.id for job in scheduler.get_jobs()]:
-                     scheduler.remove_job(job_id)
-    
                  flash('Schedule cancelled successfully', category='success')
                  return redirect(url_for('views.scheduler_status'))
 
 def scheduled_job(schedule_id, app):
     with app.app_context():
         schedule = ScraperSchedule.query.get(schedule_id)
+        if schedule is None or not schedule.active:
+            return  # deleted or paused since the worker last synced its jobs
         current_time = datetime.datetime.now()
-        schedule_time = datetime.time(SCHEDULE_HOUR, SCHEDULE_MINUTE)
+        schedule_time = schedule_slot(schedule_id)
         next_run = datetime.datetime.combine(current_time.date(), schedule_time)
         if current_time > next_run:
             next_run = next_run + datetime.timedelta(days=1)
         schedule.next_run = next_run
-        results = run_scraper(
-            city=schedule.city,
-            country=schedule.country,
-            product=schedule.product,
-            target_price=schedule.target_price,
-            should_send_email=True,
-            user_id=schedule.user_id
+        enqueue(
+            schedule.user_id,
+            schedule.product,
+            float(schedule.target_price),
+            schedule.city,
+            schedule.country,
+            True,
+            schedule_id=schedule.id
         )
-        
         schedule.last_run = current_time
-        
-        # Only create ScraperResult if results contain valid data
-        if results and isinstance(results, list) and len(results) > 0:
-            for result in results:
-                if result.get('store') and result.get('price'):  # Verify required fields exist
-                    scraper_result = ScraperResult(
-                        data=json.dumps(result),
-                        user_id=schedule.user_id,
-                        product=schedule.product,
-                        target_price=schedule.target_price,
-                        city=schedule.city,
-                        country=schedule.country,
-                        email_notification=True,
-                        store=result.get('store'),  # Explicitly set store
-                        price=float(result.get('price', 0))  # Explicitly set price
-                    )
-                    db.session.add(scraper_result)
         db.session.commit()
 @views.route('/create-schedule', methods=['POST'])
 @login_required
@@ -310,17 +565,12 @@ def create_schedule():
     
     # Default values
     interval = 24*60  # 24 hours in minutes
-    schedule_time = datetime.time(SCHEDULE_HOUR, SCHEDULE_MINUTE)
     
     # For development testing
     if current_app.debug:
         custom_interval = request.form.get('customInterval')
-        custom_time = request.form.get('customTime')
         if custom_interval:
             interval = int(custom_interval)
-        if custom_time:
-            hour, minute = map(int, custom_time.split(':'))
-            schedule_time = datetime.time(hour, minute)
     
     current_time = datetime.datetime.now()
     next_run_time = current_time + datetime.timedelta(minutes=interval)
@@ -340,17 +590,7 @@ def create_schedule():
     
     db.session.add(new_schedule)
     db.session.commit()
-    schedule_time = datetime.time(SCHEDULE_HOUR, SCHEDULE_MINUTE)
-
-    scheduler.add_job(
-            func=scheduled_job,
-            args=[new_schedule.id, current_app._get_current_object()],
-            trigger='cron',
-            hour=schedule_time.hour,
-            minute=schedule_time.minute,
-            id=f'schedule_{new_schedule.id}',
-            replace_existing=True
-        )
+    # The worker's scheduler picks up active schedules (tasks.sync_schedules)
     flash('Schedule created successfully', category='success')
     return redirect(url_for('views.scheduler_status'))
 
@@ -361,9 +601,6 @@ def cleanup_schedules():
     schedules = ScraperSchedule.query.filter_by(user_id=current_user.id).all()
     for schedule in schedules:
         schedule.active = False
-        job_id = f'schedule_{schedule.id}'
-        if job_id in [job.id for job in scheduler.get_jobs()]:
-            scheduler.remove_job(job_id)
     
     db.session.commit()
     flash('All schedules cleaned up successfully', category='success')
@@ -375,6 +612,8 @@ def update_location():
     user = current_user
     user.city = request.form.get('city')
     user.country = request.form.get('country')
+    user.latitude = None  # geocoded again by the worker on the next search
+    user.longitude = None
     db.session.commit()
     flash('Location updated successfully!', category='success')
     return redirect(url_for('views.scheduler_status'))
@@ -397,8 +636,6 @@ def update_preferences():
 @views.route('/resume_schedule/<int:schedule_id>', methods=['POST'])
 @login_required
 def resume_schedule(schedule_id):
-    from flask import current_app
-    
     schedule = ScraperSchedule.query.get_or_404(schedule_id)
     if schedule.user_id != current_user.id:
         flash('Unauthorized access', category='error')
@@ -407,18 +644,7 @@ def resume_schedule(schedule_id):
     # Reactivate the schedule in database
     schedule.active = True
     current_time = datetime.datetime.now()
-    schedule_time = datetime.time(SCHEDULE_HOUR, SCHEDULE_MINUTE)
-    
-    # Add job back to scheduler using cron trigger for daily execution
-    scheduler.add_job(
-        func=scheduled_job,
-        args=[schedule.id, current_app._get_current_object()],
-        trigger='cron',
-        hour=schedule_time.hour,
-        minute=schedule_time.minute,
-        id=f'schedule_{schedule.id}',
-        replace_existing=True
-    )
+    schedule_time = schedule_slot(schedule.id)
 
     # Update next run time based on schedule time
     next_run = datetime.datetime.combine(current_time.date(), schedule_time)
@@ -440,11 +666,6 @@ def delete_schedule(schedule_id):
         flash('Unauthorized access', category='error')
         return redirect(url_for('views.scheduler_status'))
 
-    # Remove from scheduler if job exists
-    job_id = f'schedule_{schedule_id}'
-    if job_id in [job.id for job in scheduler.get_jobs()]:
-        scheduler.remove_job(job_id)
-
     # Delete the schedule from database
     db.session.delete(schedule)
     db.session.commit()
@@ -0,0 +1,24 @@
+"""
+Scrape worker: runs queued search jobs outside the web process.
+
+    python worker.py
+
+Start as many as the machine allows; they share the job table. The worker
+also brings the schema up to date and runs the scheduler (saved searches,
+schedules, notification emails). When running several workers, set
+RUN_SCHEDULER=0 on all but one. With METRICS_PORT set, the worker's metrics
+are served at http://METRICS_HOST:METRICS_PORT/metrics.
+"""
+import os
+from website import create_app, init_db, metrics
+from website.job_queue import work
+
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "1") == "1"
+
+app = create_app(start_scheduler=RUN_SCHEDULER)
+
+if __name__ == '__main__':
+    init_db(app)
+    if metrics.METRICS_PORT:
+        metrics.serve()
+    work(app)